@@ -0,0 +1,89 @@
+"""
+Compare the JSON backends and MessagePack on payloads shaped like luckycharms responses.
+
+Run with `python benchmarks/json_backends.py`. Backends that are not installed are skipped.
+"""
+import datetime
+import importlib
+import timeit
+
+from luckycharms.codecs import get_codec, get_msgpack_codec
+
+
+def wide_page():
+    """A page of 25 resources with 60 fields of mixed types."""
+    now = datetime.datetime(2019, 1, 1).isoformat()
+    return {
+        'data': [
+            {
+                **{f'int_{idx}': idx * row for idx in range(20)},
+                **{f'str_{idx}': f'value {idx} for row {row}' for idx in range(20)},
+                **{f'bool_{idx}': bool(idx % 2) for idx in range(10)},
+                **{f'float_{idx}': idx / 3 for idx in range(5)},
+                **{f'dt_{idx}': now for idx in range(5)},
+            }
+            for row in range(25)
+        ],
+        'page_size': 25,
+        'next_page': True
+    }
+
+
+def narrow_export():
+    """An unpaged export of 10k resources with two fields."""
+    return {'data': [{'id': idx, 'name': f'name {idx}'} for idx in range(10000)]}
+
+
+def nested_page():
+    """A page of 25 resources, each with a list of three nested resources."""
+    return {
+        'data': [
+            {
+                'a': row,
+                'b': f'item {row}',
+                'children': [
+                    {'id': child, 'name': f'child {child}', 'score': child / 3}
+                    for child in range(3)
+                ]
+            }
+            for row in range(25)
+        ],
+        'page_size': 25,
+        'next_page': True
+    }
+
+
+def codecs():
+    """Yield the installed codecs."""
+    for name in ('json', 'orjson', 'rapidjson', 'ujson'):
+        if name != 'json':
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                continue
+        yield get_codec(name)
+    if get_msgpack_codec() is not None:
+        yield get_msgpack_codec()
+
+
+def main():
+    """Time encoding and decoding of each payload with each installed backend."""
+    payloads = {
+        'wide page': wide_page(),
+        'nested page': nested_page(),
+        'narrow export': narrow_export(),
+    }
+    print(f'{"backend":<10} {"payload":<14} {"encode ms":>10} {"decode ms":>10} {"bytes":>9}')
+    for codec in codecs():
+        name = codec.name
+        for label, payload in payloads.items():
+            encoded = codec.dumps_bytes(payload)
+            number = 20
+            encode = timeit.timeit(lambda: codec.dumps(payload), number=number) / number
+            decode = timeit.timeit(lambda: codec.loads(encoded), number=number) / number
+            print(f'{name:<10} {label:<14} {encode * 1000:>10.3f} {decode * 1000:>10.3f} '
+                  f'{len(encoded):>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Benchmark every stage of the decorator pipeline inside a Flask test app.
+
+Each case times one stage for one schema shape (small, wide or nested) and collection size, and
+reports throughput, latency percentiles and peak memory (tracemalloc). Results can be saved as a
+baseline and later runs compared against it:
+
+    python benchmarks/pipeline.py --save benchmarks/baseline.json
+    python benchmarks/pipeline.py --compare benchmarks/baseline.json --fail-on-regression
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+from flask import Flask, request
+from marshmallow import Schema, fields
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+
+from luckycharms.base import (  # noqa: E402  # isort:skip
+    _REQUEST_STATE, BaseModelSchema, QuerystringCollection, RequestState, split_fields)
+from protobuffers import proto  # noqa: E402  # isort:skip
+
+app = Flask(__name__)
+
+SIZES = (1, 25, 1000, 10000)
+QUICK_SIZES = (1, 25, 1000)
+
+
+class ExportQuerystringCollection(QuerystringCollection):
+    """Allow page=* with any fields so collections of every size can be requested."""
+
+    config = {'unconditional_paging': True}
+
+
+class SmallSchema(BaseModelSchema):
+    """Three primitive fields."""
+
+    a = fields.Int(order=('asc', 'desc'))
+    b = fields.String()
+    c = fields.Boolean()
+
+    config = {
+        'querystring_schemas': {'load_many': ExportQuerystringCollection},
+        'protobuffers': {
+            'load': proto.Test(),
+            'load_many': proto.Test(),
+            'dump': proto.Test(),
+            'dump_many': proto.TestCollection()
+        }
+    }
+
+
+WideSchema = type('WideSchema', (BaseModelSchema,), {
+    **{f'int_{idx}': fields.Int() for idx in range(20)},
+    **{f'str_{idx}': fields.String() for idx in range(20)},
+    **{f'bool_{idx}': fields.Boolean() for idx in range(10)},
+    **{f'float_{idx}': fields.Float() for idx in range(5)},
+    **{f'dt_{idx}': fields.DateTime() for idx in range(5)},
+    'int_0': fields.Int(order=('asc', 'desc')),
+    'config': {'querystring_schemas': {'load_many': ExportQuerystringCollection}},
+    '__doc__': 'Sixty fields of mixed types.',
+})
+
+
+class ChildSchema(Schema):
+    """Schema nested in NestedSchema."""
+
+    id = fields.Int()
+    name = fields.String()
+    score = fields.Float()
+
+
+class NestedSchema(BaseModelSchema):
+    """Primitive fields plus a nested list of children."""
+
+    a = fields.Int(order=('asc', 'desc'))
+    b = fields.String()
+    children = fields.List(fields.Nested(ChildSchema))
+
+    config = {'querystring_schemas': {'load_many': ExportQuerystringCollection}}
+
+
+def small_item(idx):
+    """Build a SmallSchema model."""
+    return types.SimpleNamespace(a=idx, b=f'item {idx}', c=bool(idx % 2))
+
+
+def wide_item(idx):
+    """Build a WideSchema model."""
+    return types.SimpleNamespace(
+        **{f'int_{col}': idx * col for col in range(20)},
+        **{f'str_{col}': f'value {col} {idx}' for col in range(20)},
+        **{f'bool_{col}': bool((idx + col) % 2) for col in range(10)},
+        **{f'float_{col}': idx / (col + 1) for col in range(5)},
+        **{f'dt_{col}': datetime.datetime(2019, 1, 1 + col, idx % 24) for col in range(5)},
+    )
+
+
+def nested_item(idx):
+    """Build a NestedSchema model."""
+    return types.SimpleNamespace(a=idx, b=f'item {idx}', children=[
+        types.SimpleNamespace(id=child, name=f'child {child}', score=child / 3)
+        for child in range(3)
+    ])
+
+
+# schema class, model factory, fields projection, order_by field
+SHAPES = {
+    'small': (SmallSchema, small_item, 'a,b', 'a'),
+    'wide': (WideSchema, wide_item, 'int_0,str_0', 'int_0'),
+    'nested': (NestedSchema, nested_item, 'a,children', 'a'),
+}
+
+
+def build_cases(sizes):
+    """Yield (name, setup) pairs; setup returns the callable that is timed."""
+    # pylint: disable=protected-access,cell-var-from-loop
+    for shape, (schema_class, make_item, projection, order_by) in SHAPES.items():
+        schema = schema_class(many=True)
+        compiled = type(schema_class.__name__, (schema_class,), {
+            'config': {**schema_class.config, 'compiled_dump': True, 'compiled_load': True}
+        })(many=True)
+        for size in sizes:
+            items = [make_item(idx) for idx in range(size)]
+            dumped = schema._serialize(items, many=True)
+            body = json.dumps(dumped)
+            querystring = f'/?page=*&fields={projection}&order_by={order_by}&order=desc'
+            prefix = f'{shape}/{size}'
+
+            yield f'{prefix}/querystring', lambda qs=querystring, s=schema: (
+                qs, None, lambda: s.querystring_schema.load(request.args))
+            yield f'{prefix}/load_json', lambda b=body, s=schema: (
+                '/', {'method': 'POST', 'data': b,
+                      'headers': {'Content-Type': 'application/json'}},
+                lambda: s.load(request.data))
+            yield f'{prefix}/load_json_compiled', lambda b=body, s=compiled: (
+                '/', {'method': 'POST', 'data': b,
+                      'headers': {'Content-Type': 'application/json'}},
+                lambda: s.load(request.data))
+            if shape == 'small' and size == 1:
+                proto_body = proto.Test.dict_to_message(dumped[0]).SerializeToString()
+                single = schema_class()
+                yield f'{prefix}/load_protobuf', lambda b=proto_body, s=single: (
+                    '/', {'method': 'POST', 'data': b,
+                          'headers': {'Content-Type': 'application/octet-stream'}},
+                    lambda: s.load(request.data))
+            yield f'{prefix}/view', lambda i=items: (
+                '/', None, lambda: list(iter(i)))
+            yield f'{prefix}/dump', lambda i=items, s=schema: (
+                '/', None, _raw(s, lambda: s.dump(i)))
+            yield f'{prefix}/dump_compiled', lambda i=items, s=compiled: (
+                '/', None, _raw(s, lambda: s.dump(i)))
+            yield f'{prefix}/dump_columnar', lambda c=to_columns(items), s=schema: (
+                '/', None, _raw(s, lambda: s.dump(c)))
+            yield f'{prefix}/dump_projected', lambda i=items, s=schema, p=projection: (
+                '/', None, _raw(s, lambda: s._projected_schema(frozenset(split_fields(p))).dump(i)))
+            yield f'{prefix}/paginate', lambda i=items, s=schema: (
+                '/', None, _paged(s, lambda: {'data': s._slice_page(iter(i))}))
+            yield f'{prefix}/encode', lambda d=dumped, s=schema: (
+                '/', None, lambda: s.json_codec.dumps({'data': d, 'page_size': 25}))
+            if schema.msgpack_codec is not None:
+                packed = schema.msgpack_codec.dumps(dumped)
+                yield f'{prefix}/load_msgpack', lambda b=packed, s=schema: (
+                    '/', {'method': 'POST', 'data': b,
+                          'headers': {'Content-Type': 'application/msgpack'}},
+                    lambda: s.load(request.data))
+                yield f'{prefix}/encode_msgpack', lambda d=dumped, s=schema: (
+                    '/', None, lambda: s.msgpack_codec.dumps({'data': d, 'page_size': 25}))
+            yield f'{prefix}/end_to_end', lambda i=items, s=schema_class, qs=querystring: (
+                qs, None, s(many=True)(lambda **kwargs: i))
+
+
+def to_columns(items):
+    """Turn models into a dict of columns, held in NumPy arrays when NumPy is installed."""
+    names = list(vars(items[0]))
+    columns = {name: [getattr(item, name) for item in items] for name in names}
+    try:
+        import numpy
+    except ImportError:
+        return columns
+    return {
+        name: values if isinstance(values[0], list) else numpy.array(values)
+        for name, values in columns.items()
+    }
+
+
+def _raw(schema, func):
+    """Run func with request state that leaves collections unenveloped and unencoded."""
+    def wrapped():
+        state = RequestState(owner=schema)
+        state.streaming = True
+        token = _REQUEST_STATE.set(state)
+        try:
+            return func()
+        finally:
+            _REQUEST_STATE.reset(token)
+    return wrapped
+
+
+def _paged(schema, func):
+    """Run func with request state for the first page of 25 items."""
+    def wrapped():
+        state = RequestState(owner=schema)
+        token = _REQUEST_STATE.set(state)
+        try:
+            schema.context.update({'page': 1, 'page_size': 25})
+            return func()
+        finally:
+            _REQUEST_STATE.reset(token)
+    return wrapped
+
+
+def measure(setup, budget):
+    """Time a case repeatedly for about budget seconds (at least 5 runs)."""
+    path, request_kwargs, func = setup()
+    with app.test_request_context(path, **(request_kwargs or {})):
+        func()
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < 5 or time.perf_counter() - started < budget:
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'runs': len(timings),
+        'ops_per_sec': len(timings) / sum(timings),
+        'p50_ms': statistics.median(timings) * 1000,
+        'p95_ms': timings[int(len(timings) * 0.95) - 1] * 1000,
+        'p99_ms': timings[int(len(timings) * 0.99) - 1] * 1000,
+        'peak_kib': peak / 1024,
+    }
+
+
+def main(argv=None):
+    """Run the benchmarks, print a report and optionally save or compare a baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--quick', action='store_true', help='skip 10k item collections')
+    parser.add_argument('--budget', type=float, default=0.5, help='seconds spent per case')
+    parser.add_argument('--filter', default='', help='only run cases containing this text')
+    parser.add_argument('--save', help='write results to this baseline file')
+    parser.add_argument('--compare', help='compare results with this baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p50 slowdown reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    regressions = []
+    print(f'{"case":<32} {"ops/s":>10} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} '
+          f'{"peak KiB":>10} {"vs base":>8}')
+    for name, setup in build_cases(QUICK_SIZES if args.quick else SIZES):
+        if args.filter not in name:
+            continue
+        result = results[name] = measure(setup, args.budget)
+        change = ''
+        if name in baseline:
+            ratio = result['p50_ms'] / baseline[name]['p50_ms']
+            change = f'{ratio:.2f}x'
+            if ratio > 1 + args.threshold:
+                regressions.append(name)
+                change += ' !'
+        print(f'{name:<32} {result["ops_per_sec"]:>10.1f} {result["p50_ms"]:>9.3f} '
+              f'{result["p95_ms"]:>9.3f} {result["p99_ms"]:>9.3f} {result["peak_kib"]:>10.1f} '
+              f'{change:>8}')
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+    if regressions:
+        print(f'\n{len(regressions)} case(s) slower than the baseline: {", ".join(regressions)}')
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
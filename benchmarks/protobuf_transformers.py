@@ -0,0 +1,55 @@
+"""
+Compare the descriptor based protocol buffer transformers with a JSON round-trip and with JSON.
+
+Run with `PYTHONPATH=.:tests python benchmarks/protobuf_transformers.py`.
+"""
+import json
+import timeit
+
+from google.protobuf.json_format import MessageToJson, Parse
+
+from protobuffers import proto, proto_pb2
+
+
+def json_round_trip_dump(data):
+    """Dump the way transformers that go through JSON do."""
+    message = proto_pb2.TestCollection()
+    for item in data['data']:
+        Parse(json.dumps(item), message.tests.add())
+    message.page_size = data['page_size']
+    message.next_page = data['next_page']
+    return message.SerializeToString()
+
+
+def json_round_trip_load(proto_bytes):
+    """Load the way transformers that go through JSON do."""
+    message = proto_pb2.Test()
+    message.ParseFromString(proto_bytes)
+    return json.loads(MessageToJson(message, preserving_proto_field_name=True))
+
+
+def main():
+    """Time dumping a page and loading a resource."""
+    page = {
+        'data': [{'a': idx, 'b': f'item {idx}', 'c': bool(idx % 2)} for idx in range(25)],
+        'page_size': 25,
+        'next_page': True
+    }
+    resource = proto.Test.dict_to_message(page['data'][1]).SerializeToString()
+    cases = {
+        'dump page (json)': lambda: json.dumps(page),
+        'dump page (json round-trip)': lambda: json_round_trip_dump(page),
+        'dump page (native)': lambda: proto.TestCollection.dict_to_message(
+            page).SerializeToString(),
+        'load resource (json)': lambda: json.loads(json.dumps(page['data'][1])),
+        'load resource (json round-trip)': lambda: json_round_trip_load(resource),
+        'load resource (native)': lambda: proto.Test.proto_to_dict(resource),
+    }
+    number = 2000
+    for label, case in cases.items():
+        elapsed = timeit.timeit(case, number=number) / number
+        print(f'{label:<34} {elapsed * 1e6:>9.1f} us')
+
+
+if __name__ == '__main__':
+    main()
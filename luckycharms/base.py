@@ -1,13 +1,29 @@
 """Base schema file."""
 # pylint: disable=no-self-use,unused-argument
-import copy
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import contextvars
+import datetime
+import functools
+import hashlib
+import inspect
+import itertools
 import json
+import multiprocessing
 import os
+import sys
+import threading
+import time
+import types
+import weakref
 
-from flask import g, request
-from flask_exceptions.extension import BadRequest
-from marshmallow import Schema, ValidationError
+from flask import Response, after_this_request, g, request, stream_with_context
+from flask_exceptions.extension import APIException, BadRequest
+from marshmallow import RAISE, Schema, ValidationError
 from marshmallow import fields as _fields
+from marshmallow import missing as _missing
 from marshmallow import (
     post_dump,
     post_load,
@@ -17,6 +33,21 @@ from marshmallow import (
     validates,
     validates_schema,
 )
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+from marshmallow.utils import is_collection
+
+from .cache import CachedResponse
+from .codecs import get_codec, get_msgpack_codec
+from .columnar import (
+    column_length,
+    column_names,
+    column_rows,
+    column_slice,
+    is_columnar,
+    serialize_columns,
+)
+from .compiled import compile_dump, compile_load
+from .compression import get_encoding
 
 try:
     from google.protobuf.message import DecodeError
@@ -38,18 +69,288 @@ try:
 except (ValueError, TypeError):
     MAX_PAGES = 50
 
+_PROJECTION_CACHE_SIZE_ENV_VAR = os.environ.get('LUCKYCHARMS_PROJECTION_CACHE_SIZE')
+try:
+    PROJECTION_CACHE_SIZE = int(_PROJECTION_CACHE_SIZE_ENV_VAR)
+except (ValueError, TypeError):
+    PROJECTION_CACHE_SIZE = 128
+
+JSON_BACKEND = os.environ.get('LUCKYCHARMS_JSON_BACKEND', 'json')
+
+# Number of items serialized at a time by streamed collection responses, and validated at a time
+# from streamed request bodies
+STREAM_CHUNK_SIZE = 100
+
+# Request body types read and validated incrementally for collections
+NDJSON_MIMETYPE = 'application/x-ndjson'
+DELIMITED_PROTOBUF_MIMETYPE = 'application/x-protobuf-delimited'
+STREAMED_MIMETYPES = (NDJSON_MIMETYPE, DELIMITED_PROTOBUF_MIMETYPE)
+
+# Request and response types encoded with MessagePack (when msgpack is installed)
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
 _SHOW_ERR_ENV_VAR = os.environ.get('LUCKYCHARMS_SHOW_ERRORS', 'False')
 SHOW_ERRORS = _SHOW_ERR_ENV_VAR in ['True', 'true']
 
 
+# Querystring plans, shared by all instances of a querystring schema class
+_QUERYSTRING_PLANS = {}
+
+# Configuration and querystring schemas derived from model schema classes, shared by their instances
+_SCHEMA_CONFIGS = weakref.WeakKeyDictionary()
+_QUERYSTRING_SCHEMAS = weakref.WeakKeyDictionary()
+
+# State for the request currently being handled by a decorated view
+_REQUEST_STATE = contextvars.ContextVar('luckycharms_request_state', default=None)
+
+
+@functools.lru_cache(maxsize=None)
+def _parallel_executor():
+    """
+    Executor for parallel dumps: a process pool, or a thread pool where threads run Python code
+    in parallel (free-threaded builds).
+    """
+    if not getattr(sys, '_is_gil_enabled', lambda: True)():
+        return concurrent.futures.ThreadPoolExecutor()
+    # Forking from a threaded server could copy locks held by other threads into the workers
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return concurrent.futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context(method))
+
+
+# Schemas rebuilt by parallel dump workers, by class and arguments (each projection has its own),
+# kept LRU-style
+_WORKER_SCHEMAS = collections.OrderedDict()
+_WORKER_SCHEMAS_LOCK = threading.Lock()
+
+
+def _dump_chunk(schema_class, kwargs, context, chunk):
+    """
+    Dump and encode a chunk of a collection in a parallel dump worker. Return the encoded items,
+    separated as in a JSON array but without its brackets.
+    """
+    key = (schema_class, repr(sorted(kwargs.items())))
+    with _WORKER_SCHEMAS_LOCK:
+        schema = _WORKER_SCHEMAS.get(key)
+        if schema is not None:
+            _WORKER_SCHEMAS.move_to_end(key)
+    if schema is None:
+        schema = schema_class(**kwargs, _dump_only=True)
+        with _WORKER_SCHEMAS_LOCK:
+            schema = _WORKER_SCHEMAS.setdefault(key, schema)
+            if len(_WORKER_SCHEMAS) > PROJECTION_CACHE_SIZE:
+                _WORKER_SCHEMAS.popitem(last=False)
+
+    # Leave the items unenveloped and unencoded, as for streamed responses
+    state = RequestState(owner=schema)
+    state.streaming = True
+    state.context = context
+    token = _REQUEST_STATE.set(state)
+    try:
+        items = schema.dump(chunk, many=True)
+    finally:
+        _REQUEST_STATE.reset(token)
+    return schema.json_codec.dumps_bytes(items)[1:-1]
+
+
+class PhaseTiming(collections.namedtuple('PhaseTiming', ('phase', 'duration', 'items', 'size'))):
+    """Duration in seconds of a phase of a decorated view, with the item count and byte size."""
+
+    __slots__ = ()
+
+
+class RequestState(object):
+    """Request-local state shared by a decorated view and the schemas serializing its response."""
+
+    __slots__ = (
+        'owner', 'context', 'next_page', 'next_cursor', 'streaming', 'dumper', 'plan',
+        'cache_key', 'timings', 'dump_start', 'load_offset')
+
+    def __init__(self, timed=False, owner=None):
+        """Start every request with an empty serialization context."""
+        # The decorator handling the request: only it and its projections read this state
+        self.owner = owner
+        self.context = {}
+        self.next_page = False
+        self.next_cursor = None
+        self.streaming = False
+        self.dumper = None
+        self.plan = None
+        self.cache_key = None
+        self.timings = [] if timed else None
+        self.dump_start = None
+        self.load_offset = 0
+
+    def start(self):
+        """Return the start time of a phase, or None when timings are not recorded."""
+        return None if self.timings is None else time.perf_counter()
+
+    def record(self, phase, start, items=None, size=None):
+        """Record a phase begun at start, unless timings are not recorded."""
+        if start is not None:
+            self.timings.append(PhaseTiming(phase, time.perf_counter() - start, items, size))
+
+
+@functools.lru_cache(maxsize=1024)
+def split_fields(value):
+    """Tokenize a comma-separated `fields` querystring value into a tuple of field names."""
+    return tuple(value.split(','))
+
+
+class Keyset(collections.namedtuple('Keyset', ('value', 'tiebreaker'))):
+    """The `order_by` and tiebreaker values of the last item on the previous page."""
+
+    __slots__ = ()
+
+
+class QueryPlan(collections.namedtuple('QueryPlan', (
+        'attributes', 'fields', 'order_by', 'order', 'page', 'page_size', 'cursor', 'offset',
+        'limit'))):
+    """
+    What a decorated view has to fetch: the model attributes that will be serialized (the
+    `attribute` of every requested field, plus the attributes Method and Function fields declare
+    with `requires`), the requested fields (None for all of them), the ordering attribute and the
+    page bounds (`offset` and `limit`, which includes the item that tells whether a page follows).
+    """
+
+    __slots__ = ()
+
+
+# Querystring arguments replaced by the query plan passed to views
+_PLANNED_ARGUMENTS = ('fields', 'order_by', 'order', 'page', 'page_size', 'cursor')
+
+
+def encode_cursor(order_by, order, value, tiebreaker):
+    """Encode the keyset of an item, with the ordering it was taken from, as an opaque cursor."""
+    payload = json.dumps([order_by, order, value, tiebreaker], separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor to [order_by, order, value, tiebreaker], raising ValueError if malformed."""
+    decoded = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(decoded, list) or len(decoded) != 4:
+        raise ValueError('Not a valid cursor.')
+    return decoded
+
+
+def last_modified(items):
+    """Most recent `updated_dt` (or `created_dt` when not updated) of the given resources."""
+    stamps = [
+        item.updated_dt or getattr(item, 'created_dt', None)
+        for item in items if hasattr(item, 'updated_dt')
+    ]
+    stamps = [stamp for stamp in stamps if stamp]
+    return max(stamps) if stamps else None
+
+
+def _http_datetime(value):
+    """Convert a datetime to the second-precision, timezone aware value sent in HTTP headers."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.replace(microsecond=0)
+
+
+class QuerystringPlan(object):
+    """Precompiled lookups used to parse querystrings for a querystring schema class."""
+
+    __slots__ = ('field_names', 'list_keys')
+
+    def __init__(self, field_names):
+        """Freeze the accepted argument names and the `[]` keys that carry lists."""
+        self.field_names = frozenset(field_names)
+        self.list_keys = {name + '[]': name for name in self.field_names}
+
+    def parse(self, args_lists):
+        """Build load data from (key, values) pairs in one pass, rejecting unknown arguments."""
+        data = {}
+        for key, values in args_lists:
+            name = self.list_keys.get(key)
+            if name is not None:
+                data[name] = values
+            elif key in self.field_names:
+                data[key] = values[0]
+            else:
+                name = key[:-2] if key.endswith('[]') else key
+                raise ValidationError(f'{name} is an invalid querystring argument.')
+        return data
+
+
+class _BoundedStream(object):
+    """Request stream of unknown length that rejects the body once it exceeds a size."""
+
+    __slots__ = ('stream', 'remaining')
+
+    def __init__(self, stream, max_length):
+        """Wrap stream."""
+        self.stream = stream
+        self.remaining = max_length
+
+    def _count(self, data):
+        """Count bytes read from the stream."""
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            raise APIException(413, message='Request body too large.')
+        return data
+
+    def read(self, size):
+        """Read at most size bytes."""
+        return self._count(self.stream.read(size))
+
+    def __iter__(self):
+        """Iterate over the lines of the stream."""
+        return (self._count(line) for line in self.stream)
+
+
 class ErrorHandlingSchema(Schema):
     """Base schema class that knows how to handle errors."""
+
+    # Number of errors (invalid items, for collections) after which validation stops
+    max_errors = None
+
+    def _budget_spent(self, error_store):
+        """Whether validation has found as many errors as it is allowed to."""
+        return self.max_errors is not None and len(error_store.errors) >= self.max_errors
+
+    def _deserialize(self, data, *, error_store, many=False, partial=False, unknown=RAISE,
+                     index=None):
+        """Stop deserializing the items of a collection once the error budget is spent."""
+        if self.max_errors is None or not many or not is_collection(data):
+            return super(ErrorHandlingSchema, self)._deserialize(
+                data, error_store=error_store, many=many, partial=partial, unknown=unknown,
+                index=index)
+
+        ret = []
+        for idx, item in enumerate(data):
+            ret.append(self._deserialize(
+                item, error_store=error_store, many=False, partial=partial, unknown=unknown,
+                index=idx))
+            if self._budget_spent(error_store):
+                break
+        return ret
+
+    def _invoke_field_validators(self, *, error_store, data, many):
+        """Skip field validators once the error budget is spent."""
+        if not self._budget_spent(error_store):
+            super(ErrorHandlingSchema, self)._invoke_field_validators(
+                error_store=error_store, data=data, many=many)
+
+    def _invoke_schema_validators(self, *, error_store, **kwargs):
+        """Skip schema validators once the error budget is spent."""
+        if not self._budget_spent(error_store):
+            super(ErrorHandlingSchema, self)._invoke_schema_validators(
+                error_store=error_store, **kwargs)
+
     def handle_error(self, error, data, **kwargs):  # pylint: disable=arguments-differ
         """Overridden method to return 400s."""
         msg = ''
         # v may be a dictionary instead of a list
         if SHOW_ERRORS:
+            # Items of streamed bodies are validated a chunk at a time, but reported by position
+            state = _REQUEST_STATE.get()
+            offset = state.load_offset if state is not None else 0
             for key, value in error.messages.items():
+                if offset and isinstance(key, int):
+                    key += offset
                 if isinstance(value, dict):
                     val = str(value)
                 else:
@@ -67,51 +368,329 @@ class BaseModelSchema(ErrorHandlingSchema):
 
     def __init__(self, *args, **kwargs):
         """Extended init method for BaseModelSchema to initialize with configuration."""
+        # Projections and parallel dump workers only dump, so they have no querystring schema of
+        # their own (one per distinct `only` would be built and kept)
+        dump_only = kwargs.pop('_dump_only', False)
         super(BaseModelSchema, self).__init__(*args, **kwargs)
 
-        default_config = {
-            'paged': True,
-            'querystring_schemas': {
-                'load': QuerystringResource,
-                'load_many': QuerystringCollection
-            }
-        }
-        self.config = {**default_config, **getattr(self, 'config', {})}
-        if 'load' not in self.config['querystring_schemas']:
-            self.config['querystring_schemas']['load'] = QuerystringResource
-        if 'load_many' not in self.config['querystring_schemas']:
-            self.config['querystring_schemas']['load_many'] = QuerystringCollection \
-                if self.config["paged"] else UnpagedQuerystringCollection
+        self.config = _SCHEMA_CONFIGS.get(type(self))
+        if self.config is None:
+            self.config = _SCHEMA_CONFIGS.setdefault(type(self), self._merge_config())
 
         if self.config.get('protobuffers') and not PROTBUF_IMPORTED:
             raise Exception(
                 "protobuffer libraries not installed; please install"
                 " luckycharms with extra 'proto' (for example, pip install luckycharms[proto])")
 
-        self.set_querystring_schema(**kwargs)
+        if self.config['paged'] == 'cursor' and \
+                self.config.get('tiebreaker', 'id') not in self.declared_fields:
+            raise Exception(
+                f'Tiebreaker field "{self.config.get("tiebreaker", "id")}" is not declared.')
+
+        # Fields whose values are resolved for a whole collection at once
+        self._loader_fields = {
+            name: field for name, field in self.dump_fields.items() if 'loader' in field.metadata}
+        for name, field in self._loader_fields.items():
+            if isinstance(field, _fields.Function):
+                raise Exception(f'Function field "{name}" can\'t have a loader.')
+
+        if self.config.get('query_plan'):
+            for name, field in self.dump_fields.items():
+                if isinstance(field, (_fields.Method, _fields.Function)) and \
+                        'requires' not in field.metadata and 'loader' not in field.metadata:
+                    raise Exception(f'Field "{name}" must declare the attributes it requires.')
+        self._dump_attributes = None
+        self._compiled_dump = None
+        self._compiled_loads = {}
+
+        self.json_codec = get_codec(self.config.get('json_backend', JSON_BACKEND))
+        self.msgpack_codec = get_msgpack_codec()
+
+        # Installed compression backends, in order of preference
+        self.compression = self.config.get('compression')
+        self.encodings = {}
+        if self.compression is not None:
+            for name in self.compression.get('encodings', ('br', 'zstd', 'gzip')):
+                encoding = get_encoding(name)
+                if encoding is not None:
+                    self.encodings[name] = encoding
+
+        self.cache = self.config.get('cache')
+        if self.cache is not None and 'backend' not in self.cache:
+            raise Exception('A backend must be provided to cache responses.')
+        self.cache_namespace = None
+
+        # Serialized objects, keyed by the schema and the fields it serializes
+        self.fragment_cache = self.config.get('fragment_cache')
+        if self.fragment_cache is not None:
+            if 'backend' not in self.fragment_cache:
+                raise Exception('A backend must be provided to cache fragments.')
+            namespace = self.fragment_cache.get('namespace') or \
+                f'{type(self).__module__}.{type(self).__qualname__}'
+            projection = hashlib.sha1(','.join(sorted(self.dump_fields)).encode('utf-8'))
+            self._fragment_prefix = f'{namespace}:{projection.hexdigest()[:16]}:'
+
+        self.max_errors = self.config.get('max_errors')
+
+        self.timed = bool(self.config.get('metrics') or self.config.get('server_timing'))
+        self.view_name = None
+
+        if not dump_only:
+            self.set_querystring_schema(**kwargs)
+
+        # Decorator whose request state this instance reads (see _request_state)
+        self._state_owner = self
+
+        # Schemas restricted to a `fields` projection are built on first use and kept LRU-style
+        self._init_kwargs = kwargs
+        self._projected_schema = functools.lru_cache(maxsize=PROJECTION_CACHE_SIZE)(
+            self._build_projection)
+
+    def _init_fields(self):
+        """
+        Bind fields in declaration order: marshmallow collects field names (and `only`) in sets,
+        which would order the serialized keys differently in each process.
+        """
+        super(BaseModelSchema, self)._init_fields()
+        order = {name: idx for idx, name in enumerate(self.declared_fields)}
+        for name in ('fields', 'load_fields', 'dump_fields'):
+            bound = getattr(self, name)
+            setattr(self, name, self.dict_class(
+                sorted(bound.items(), key=lambda item: order.get(item[0], len(order)))))
+
+    @classmethod
+    def _merge_config(cls):
+        """Merge the config of a schema class with defaults, as a read-only mapping."""
+        schema_config = getattr(cls, 'config', {})
+        config = {'paged': True, **schema_config}
+        querystring_schemas = dict(config.get('querystring_schemas', {}))
+        if 'load' not in querystring_schemas:
+            querystring_schemas['load'] = QuerystringResource
+        if 'load_many' not in querystring_schemas:
+            if config['paged'] == 'cursor':
+                querystring_schemas['load_many'] = CursorQuerystringCollection
+            elif config['paged'] or 'querystring_schemas' not in schema_config:
+                querystring_schemas['load_many'] = QuerystringCollection
+            else:
+                querystring_schemas['load_many'] = UnpagedQuerystringCollection
+        config['querystring_schemas'] = types.MappingProxyType(querystring_schemas)
+        return types.MappingProxyType(config)
 
     def __call__(self, decorated):
         """Make BaseModelSchema callable so it can be used as a decorator."""
 
         self._decorated = decorated  # pylint: disable=attribute-defined-outside-init
+        self.view_name = f'{decorated.__module__}.{decorated.__qualname__}'
+        if self.cache is not None:
+            self.cache_namespace = self.cache.get('namespace') or self.view_name
+        if inspect.iscoroutinefunction(decorated):
+            return self.coroutine_wrapper
         return self.function_wrapper
 
+    def invalidate_cache(self):
+        """Drop every response cached for the decorated view."""
+        if self.cache is not None:
+            self.cache['backend'].invalidate(self.cache_namespace)
+
+    def _request_state(self):
+        """State of the request handled by this schema as a decorator, if there is one."""
+        state = _REQUEST_STATE.get()
+        return state if state is not None and state.owner is self._state_owner else None
+
+    @property
+    def context(self):
+        """Serialization context of the current request, if any, else of the instance."""
+        state = self._request_state()
+        return self._context if state is None else state.context
+
+    @context.setter
+    def context(self, value):
+        """Set the context used outside of decorated views."""
+        self._context = value
+
     def function_wrapper(self, **kwargs):
         """Wrapper to be returned by __call__ that will wrap all decorated view helpers."""
 
-        # Workaround until marshmallow provides a way to specify fields at serialization time.
-        self.context = {}
-        self.only = None
+        # Per-request state lives in a context variable so that a single decorator instance can
+        # serve concurrent requests
+        state = RequestState(self.timed, self)
+        token = _REQUEST_STATE.set(state)
+        try:
+            cached = self._before_view(kwargs)
+            if cached is not None:
+                return self._conditional_response(cached, self._compress(cached))
+
+            # Call decorated function
+            start = state.start()
+            data = self._slice_page(self._decorated(**kwargs))
+            state.record('view', start, self._count(data))
+
+            return self._after_view(data)
+        finally:
+            if state.timings is not None:
+                self._report_timings(state.timings, streamed=state.streaming)
+            _REQUEST_STATE.reset(token)
+
+    async def coroutine_wrapper(self, **kwargs):
+        """Wrapper to be returned by __call__ for decorated coroutine functions."""
+
+        state = RequestState(self.timed, self)
+        token = _REQUEST_STATE.set(state)
+        try:
+            cached = self._before_view(kwargs)
+            if cached is not None:
+                return self._conditional_response(cached, self._compress(cached))
+
+            start = state.start()
+            data = self._slice_page(await self._decorated(**kwargs))
+            state.record('view', start, self._count(data))
+
+            # Serialize large collections in an executor so that the event loop is not blocked
+            threshold = self.config.get('offload_dump')
+            if threshold is not None and self.many and data is not None and \
+                    (not hasattr(data, '__len__') or self._size(data) >= threshold):
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.config.get('dump_executor'),
+                    contextvars.copy_context().run, self._after_view, data)
+
+            return self._after_view(data)
+        finally:
+            if state.timings is not None:
+                self._report_timings(state.timings, streamed=state.streaming)
+            _REQUEST_STATE.reset(token)
+
+    def _load_stream(self, content_type, state):
+        """
+        Lazily read the items of a streamed request body, validating them a chunk at a time as
+        the decorated view iterates over them.
+        """
+        stream = request.stream
+        max_length = self.config.get('max_content_length')
+        if max_length is not None and request.content_length is None:
+            stream = _BoundedStream(stream, max_length)
+        if content_type.startswith(NDJSON_MIMETYPE):
+            items = self._read_ndjson(stream)
+        else:
+            items = self._read_delimited_protobuf(stream)
+
+        max_items = self.config.get('max_items')
+        count = duration = 0
+        while True:
+            start = time.perf_counter()
+            chunk = list(itertools.islice(items, STREAM_CHUNK_SIZE))
+            if not chunk:
+                break
+            if max_items is not None and count + len(chunk) > max_items:
+                raise APIException(413, message='Too many items.')
+            state.load_offset = count
+            try:
+                loaded = self.load(chunk, many=True)
+            finally:
+                state.load_offset = 0
+                duration += time.perf_counter() - start
+            count += len(chunk)
+            yield from loaded
+
+        if state.timings is not None:
+            state.timings.append(PhaseTiming('load', duration, count, None))
+
+    @staticmethod
+    def _read_body(max_length):
+        """Read a request body of unknown length, rejecting it once it exceeds max_length."""
+        body = request.stream.read(max_length + 1)
+        if len(body) > max_length:
+            raise APIException(413, message='Request body too large.')
+        return body
+
+    def _read_ndjson(self, stream):
+        """Decode newline-delimited JSON documents from a stream, skipping blank lines."""
+        for line in stream:
+            if line.strip():
+                try:
+                    yield self.json_codec.loads(line)
+                except self.json_codec.decode_errors:
+                    raise BadRequest(message='Invalid json data')
+
+    def _read_delimited_protobuf(self, stream):
+        """Decode messages, each prefixed by its size as a varint, from a stream."""
+        transformer = self.config['protobuffers']['load']
+        while True:
+            size = shift = 0
+            while True:
+                byte = stream.read(1)
+                if not byte:
+                    if shift:
+                        raise BadRequest(message='Invalid protocol buffer data')
+                    return
+                size |= (byte[0] & 0x7f) << shift
+                shift += 7
+                if not byte[0] & 0x80:
+                    break
+
+            message = stream.read(size)
+            if len(message) < size:
+                raise BadRequest(message='Invalid protocol buffer data')
+            try:
+                yield transformer.proto_to_dict(message)
+            except DecodeError:
+                raise BadRequest(message='Invalid protocol buffer data')
+
+    def _count(self, data):
+        """Number of items in a view's return value, if it is known without consuming it."""
+        if not self.many:
+            return 0 if data is None else 1
+        if data is not None and is_columnar(data):
+            return column_length(data)
+        return len(data) if isinstance(data, (list, tuple)) else None
+
+    @staticmethod
+    def _size(data):
+        """Number of items in a sized collection, counting the rows of columnar ones."""
+        return column_length(data) if is_columnar(data) else len(data)
+
+    def _report_timings(self, timings, streamed=False):
+        """
+        Hand phase timings to the configured metrics sink and Server-Timing header. The metrics
+        of streamed responses are reported once their body has been generated.
+        """
+        if self.config.get('metrics') and not streamed:
+            self.config['metrics'](self.view_name, timings)
+
+        if self.config.get('server_timing'):
+            header = ', '.join(
+                f'{timing.phase};dur={timing.duration * 1000:.3f}' for timing in timings)
+
+            @after_this_request
+            def set_server_timing(response):
+                """Set the Server-Timing header."""
+                response.headers['Server-Timing'] = header
+                return response
+
+    def _before_view(self, kwargs):
+        """
+        Load the request into the view arguments and prepare the request state for serializing.
+        Return the cached response for the request, if there is one.
+        """
+        state = _REQUEST_STATE.get()
+        start = state.start()
         # Load with querystring schemas for GET requests
         if request.method == 'GET':
-            params = self.querystring_schema.load((request.args.items(), request.args.lists()))
+            params = self.querystring_schema.load(request.args)
+            state.record('querystring', start)
 
-            # Set serialization fields
+            # Serialize with a schema restricted to the requested fields
             if params['fields'] != "*":
-                self.only = params['fields'].split(',')
+                state.dumper = self._projected_schema(frozenset(split_fields(params['fields'])))
 
             # Set context for use in serialization method
-            if self.many and self.config['paged']:
+            if self.many and self.config['paged'] == 'cursor':
+                self.context.update({
+                    'cursor': params['cursor'],
+                    'page_size': params['page_size'],
+                    'order_by': params.get('order_by', self.config.get('tiebreaker', 'id')),
+                    'order': params.get('order', 'asc')
+                })
+            elif self.many and self.config['paged']:
                 self.context.update({
                     'page': params['page'],
                     'page_size': params['page_size']
@@ -119,22 +698,570 @@ class BaseModelSchema(ErrorHandlingSchema):
 
         # Load with model schemas for POST, PUT requests
         else:
-            params = self.load(request.data, many=self.many)
+            content_type = request.headers.get('Content-Type', '')
+            max_length = self.config.get('max_content_length')
+            if max_length is not None and request.content_length is not None and \
+                    request.content_length > max_length:
+                raise APIException(413, message='Request body too large.')
+
+            if self.many and content_type.startswith(STREAMED_MIMETYPES):
+                params = self._load_stream(content_type, state)
+            else:
+                body = request.data if max_length is None or request.content_length is not None \
+                    else self._read_body(max_length)
+                params = self.load(body, many=self.many)
+                state.record('load', start, self._count(params), len(body))
+
+            # Collections can't be passed as keyword arguments
+            if self.many:
+                params = {'data': params}
+
+        if request.method == 'GET' and self.config.get('query_plan'):
+            state.plan = self._query_plan(params)
+            params = {key: value for key, value in params.items() if key not in _PLANNED_ARGUMENTS}
+            params['plan'] = state.plan
 
         kwargs.update(params)
 
-        # Call decorated function
-        data = self.dump(self._decorated(**kwargs))
+        if self.cache is not None and request.method == 'GET':
+            start = state.start()
+            state.cache_key = self._cache_key(kwargs)
+            cached = self.cache['backend'].get(state.cache_key)
+            state.record('cache', start, int(cached is not None))
+            if cached is not None and cached.last_modified is not None:
+                # Hits are not dumped, so the value pre_dump_func would have set is restored
+                g.last_modified = cached.last_modified
+            return cached
+        return None
+
+    def _after_view(self, data):
+        """Serialize the (page of the) value returned by the decorated view."""
+        state = _REQUEST_STATE.get()
+        dumper = state.dumper or self
+        if state.plan is not None and data is not None:
+            self._check_plan(state.plan, data)
 
+        # Answer conditional requests before serializing when the validators allow it
+        etag = modified = None
+        conditional = self.config.get('conditional') and request.method == 'GET'
+        if conditional:
+            if data is not None:
+                # Lazy collections (page=* or unpaged) are not consumed to find the most recent item
+                if not self.many:
+                    modified = last_modified([data])
+                elif isinstance(data, (list, tuple)):
+                    modified = last_modified(data)
+                if self.config.get('etag'):
+                    etag = str(self.config['etag'](data))
+            if self._not_modified(etag, modified):
+                return self._conditional_response(CachedResponse(None, etag, modified))
+
+        if self.many and self.config.get('streaming') and \
+                request.headers.get("Accept", "application/json") == 'application/json':
+            state.streaming = True
+            chunks = self._stream_collection(dumper, data, state)
+            encoding = self._accepted_encoding()
+            if encoding is not None:
+                chunks = self.encodings[encoding].compress_chunks(chunks)
+            response = Response(stream_with_context(chunks), mimetype='application/json')
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+            if self.compression is not None:
+                response.vary.add('Accept-Encoding')
+            return response
+
+        parallel = self.config.get('parallel_dump')
+        if parallel is not None and self.many and \
+                request.headers.get("Accept", "application/json") == 'application/json' and \
+                (self._count(data) or 0) >= parallel.get('threshold', 10000):
+            data = self._dump_parallel(dumper, data, state)
+        else:
+            state.dump_start = state.start()
+            data = dumper.dump(data)
+
+        if conditional and etag is None:
+            body = data.encode('utf-8') if isinstance(data, str) else data
+            etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+        # Kept for cache hits, which restore it, even when it isn't sent as a validator
+        if modified is None:
+            modified = g.get('last_modified')
+        response = CachedResponse(data, etag, modified)
+        encoding = self._compress(response)
+        if state.cache_key is not None:
+            self.cache['backend'].set(state.cache_key, response, self.cache.get('ttl', 300))
+
+        return self._conditional_response(response, encoding)
+
+    @staticmethod
+    def _not_modified(etag, modified):
+        """Whether the client's cached copy, per If-None-Match or If-Modified-Since, is current."""
+        if request.if_none_match:
+            return etag is not None and request.if_none_match.contains_weak(etag)
+        if modified is not None and request.if_modified_since is not None:
+            return _http_datetime(modified) <= request.if_modified_since
+        return False
+
+    def _conditional_response(self, cached, encoding=None):
+        """
+        Return a 304 if the client's copy is current, else the body of a serialized response
+        (compressed with encoding, if given) with its validators attached.
+        """
+        etag, modified = self._validators(cached)
+        data = cached.body if encoding is None else cached.compressed[encoding]
+        if etag is None and modified is None and self.compression is None:
+            return data
+
+        def set_headers(response):
+            """Set the ETag, Last-Modified, Content-Encoding and Vary headers."""
+            if etag is not None:
+                # Compressed bodies are not byte for byte the same representation
+                response.set_etag(etag, weak=encoding is not None)
+            if modified is not None:
+                response.last_modified = _http_datetime(modified)
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+            if self.compression is not None:
+                response.vary.add('Accept-Encoding')
+            return response
+
+        if self._not_modified(etag, modified):
+            return set_headers(Response(status=304))
+
+        after_this_request(set_headers)
         return data
 
+    def _validators(self, cached):
+        """The ETag and last modified value of a serialized response, for conditional GETs."""
+        if not (self.config.get('conditional') and request.method == 'GET'):
+            return None, None
+        return cached.etag, cached.last_modified
+
+    def _accepted_encoding(self):
+        """The preferred content coding the client accepts, or None."""
+        if not self.encodings:
+            return None
+        return request.accept_encodings.best_match(list(self.encodings))
+
+    def _compress(self, cached):
+        """
+        Compress the body of a serialized response with the content coding negotiated from
+        Accept-Encoding, keeping the compressed body on the response so that cached responses
+        are only compressed once. Return the content coding, or None if the body is sent as is.
+        """
+        body = cached.body
+        encoding = self._accepted_encoding()
+        if encoding is None or not isinstance(body, (str, bytes)) or \
+                self._not_modified(*self._validators(cached)):
+            return None
+        if encoding not in cached.compressed:
+            body = body.encode('utf-8') if isinstance(body, str) else body
+            if len(body) < self.compression.get('min_size', 1024):
+                return None
+            state = _REQUEST_STATE.get()
+            start = state.start()
+            cached.compressed[encoding] = self.encodings[encoding].compress(body)
+            state.record('compress', start, size=len(cached.compressed[encoding]))
+        return encoding
+
+    def _cache_key(self, kwargs):
+        """
+        Build the response cache key from the view arguments (including the loaded querystring,
+        with the fields projection normalized) and the requested mimetype.
+        """
+        arguments = dict(kwargs)
+        if arguments.get('fields', '*') != '*':
+            arguments['fields'] = tuple(sorted(set(split_fields(arguments['fields']))))
+        plan = arguments.get('plan')
+        if isinstance(plan, QueryPlan) and plan.fields is not None:
+            arguments['plan'] = plan._replace(fields=tuple(sorted(set(plan.fields))))
+        key = repr((sorted(arguments.items()), request.headers.get('Accept', 'application/json')))
+        return f'{self.cache_namespace}:{hashlib.sha1(key.encode("utf-8")).hexdigest()}'
+
+    def _stream_collection(self, dumper, data, state):
+        """Serialize a collection as JSON chunks, holding at most one chunk of items at a time."""
+        state.streaming = True
+        dump_duration = encode_duration = count = size = 0
+        try:
+            body = b'{"data": ['
+            size = len(body)
+            yield body
+            separator = b''
+            for chunk in self._chunks(data):
+                # The response body is consumed after the view returns, so reinstate its state
+                start = state.start()
+                token = _REQUEST_STATE.set(state)
+                try:
+                    chunk = dumper.dump(chunk, many=True)
+                finally:
+                    _REQUEST_STATE.reset(token)
+                encode_start = state.start()
+                body = separator + b', '.join(self.json_codec.dumps_bytes(item) for item in chunk)
+                if start is not None:
+                    dump_duration += encode_start - start
+                    encode_duration += time.perf_counter() - encode_start
+                    count += len(chunk)
+                    size += len(body)
+                yield body
+                separator = b', '
+            body = self._end_collection(state)
+            size += len(body)
+            yield body
+        finally:
+            # Phases of the body are only known once it has been generated (or abandoned)
+            if state.timings is not None:
+                state.timings.append(PhaseTiming('dump', dump_duration, count, None))
+                state.timings.append(PhaseTiming('encode', encode_duration, None, size))
+                if self.config.get('metrics'):
+                    self.config['metrics'](self.view_name, state.timings)
+
+    def _dump_parallel(self, dumper, data, state):
+        """
+        Dump and encode the chunks of a large collection in an executor, and join the encoded
+        chunks in the data array of the response without decoding them.
+        """
+        parallel = self.config['parallel_dump']
+        start = state.start()
+        # Chunks don't set the last modified value, as it is the most recent of the whole page
+        if not is_columnar(data):
+            modified = last_modified(data)
+            if modified is not None:
+                g.last_modified = modified
+
+        executor = parallel.get('executor') or _parallel_executor()
+        dump = functools.partial(
+            _dump_chunk, type(dumper), dumper._init_kwargs, dict(state.context))
+        chunks = self._chunks(data, parallel.get('chunk_size', 1000))
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            # Worker processes have no request or application context
+            futures = [executor.submit(dump, chunk) for chunk in chunks]
+        else:
+            # Worker threads see the request and application contexts, as the view does
+            futures = [
+                executor.submit(contextvars.copy_context().run, dump, chunk) for chunk in chunks]
+        body = b'{"data": [' + \
+            b', '.join(chunk for chunk in (future.result() for future in futures) if chunk) + \
+            self._end_collection(state)
+        state.record('dump', start, self._count(data), len(body))
+        # Return the same type as collections dumped in the request's thread
+        return body if self.json_codec.binary else body.decode('utf-8')
+
+    def _end_collection(self, state):
+        """Close the data array of a collection encoded in chunks and add its paging fields."""
+        envelope = {}
+        if 'page' in state.context:
+            envelope = {'page_size': state.context['page_size'], 'next_page': state.next_page}
+        elif 'cursor' in state.context:
+            envelope = {'page_size': state.context['page_size'], 'next_cursor': state.next_cursor}
+        return b'], ' + self.json_codec.dumps_bytes(envelope)[1:] if envelope else b']}'
+
+    @staticmethod
+    def _chunks(data, size=STREAM_CHUNK_SIZE):
+        """Split a collection into chunks of size items, slicing columnar ones."""
+        if data is not None and is_columnar(data):
+            for start in range(0, column_length(data), size):
+                yield column_slice(data, start, start + size)
+            return
+
+        items = iter(data or ())
+        while True:
+            chunk = list(itertools.islice(items, size))
+            if not chunk:
+                return
+            yield chunk
+
+    def _slice_page(self, data):
+        """
+        Take at most one page (plus one item to detect a following page) from a paged
+        collection so that only the items in the page are ever serialized.
+        """
+        context = self.context
+        if data is None or not self.many or not (context.get('page') or 'cursor' in context):
+            return data
+
+        page_size = context['page_size']
+        state = _REQUEST_STATE.get()
+        if is_columnar(data):
+            # Columns are sliced before any of their values are converted
+            state.next_page = column_length(data) > page_size
+            if state.next_page and 'cursor' in context:
+                state.next_cursor = self._next_cursor(
+                    column_rows(column_slice(data, page_size - 1, page_size))[0])
+            return column_slice(data, 0, page_size)
+
+        data = list(itertools.islice(data, page_size + 1))
+        state.next_page = len(data) > page_size
+        if state.next_page and 'cursor' in context:
+            state.next_cursor = self._next_cursor(data[page_size - 1])
+        return data[:page_size]
+
+    def _next_cursor(self, item):
+        """Encode the cursor for the page following item."""
+        order_by = self.context['order_by']
+        tiebreaker = self.config.get('tiebreaker', 'id')
+        values = [
+            self.declared_fields[name].serialize(name, item, accessor=self.get_attribute)
+            for name in (order_by, tiebreaker)
+        ]
+        return encode_cursor(order_by, self.context['order'], *values)
+
+    def dump(self, obj, *, many=None):
+        """Serialize, leaving columnar collections whole rather than listing their columns."""
+        many = self.many if many is None else bool(many)
+        if not many or obj is None or not is_columnar(obj):
+            return super(BaseModelSchema, self).dump(obj, many=many)
+        if self._hooks[(PRE_DUMP, False)] or self._hooks[(POST_DUMP, False)]:
+            # Hooks processing items one at a time need the rows
+            return super(BaseModelSchema, self).dump(column_rows(obj), many=many)
+
+        data = self._invoke_dump_processors(PRE_DUMP, obj, many=many, original_data=obj)
+        result = self._serialize(data, many=many)
+        return self._invoke_dump_processors(POST_DUMP, result, many=many, original_data=obj)
+
+    def _serialize(self, obj, *, many=False):
+        """
+        Serialize with the dump functions generated for the schema, when configured to, reusing
+        cached fragments for unchanged objects.
+        """
+        if many and obj is not None and is_columnar(obj):
+            if not self._loader_fields and self.fragment_cache is None:
+                return serialize_columns(self, obj)
+            obj = column_rows(obj)
+        if self.fragment_cache is not None and obj is not None:
+            return self._serialize_cached(obj, many)
+        return self._serialize_fresh(obj, many)
+
+    def _serialize_cached(self, obj, many):
+        """
+        Serialize only the objects that have no fragment cached for their current version, and
+        splice the cached fragments of the others in.
+        """
+        objs = list(obj) if many else [obj]
+        keys = [self._fragment_key(item) for item in objs]
+        backend = self.fragment_cache['backend']
+        cached = backend.get_many([key for key in keys if key is not None])
+
+        stale = [item for item, key in zip(objs, keys) if key not in cached]
+        fresh = iter(self._serialize_fresh(stale, True) if stale else ())
+        result = []
+        updates = {}
+        dict_class = self.dict_class
+        for key in keys:
+            # Items are copied in and out of the cache, as post_dump hooks may modify them in place
+            fragment = cached.get(key)
+            if fragment is None:
+                fragment = next(fresh)
+                if key is not None:
+                    updates[key] = dict_class(fragment)
+            else:
+                fragment = dict_class(fragment)
+            result.append(fragment)
+
+        if updates:
+            backend.set_many(updates, self.fragment_cache.get('ttl', 3600))
+        return result if many else result[0]
+
+    def _fragment_key(self, item):
+        """
+        Fragment cache key of an object, from its primary key and version (`updated_dt`, or
+        `created_dt` when not updated), or None if it has either missing.
+        """
+        primary_key = self.get_attribute(item, self.fragment_cache.get('key', 'id'), None)
+        version = self.get_attribute(item, 'updated_dt', None) or \
+            self.get_attribute(item, 'created_dt', None)
+        if primary_key is None or version is None:
+            return None
+        return f'{self._fragment_prefix}{primary_key}:{version}'
+
+    def _serialize_fresh(self, obj, many):
+        """Serialize objects, resolving loader fields and using generated dump functions."""
+        if self._loader_fields and obj is not None:
+            return self._serialize_loaded(obj, many)
+        if self.config.get('compiled_dump') and self._compiled_dump is None:
+            self._compiled_dump = compile_dump(self) or False
+        if not self._compiled_dump:
+            # marshmallow serializes collections item by item through self._serialize, which
+            # would look fragments up again
+            serialize = super(BaseModelSchema, self)._serialize
+            if many and obj is not None:
+                return [serialize(item, many=False) for item in obj]
+            return serialize(obj, many=False)
+
+        dump, dump_many = self._compiled_dump
+        if many and obj is not None:
+            return dump_many(obj)
+        return dump(obj)
+
+    def _serialize_loaded(self, obj, many):
+        """
+        Serialize objects with the values of loader fields resolved by one call to each loader
+        for all of them, rather than by one query per object.
+        """
+        objs = list(obj) if many else [obj]
+        loaded = self._run_loaders(objs)
+        result = []
+        for index, item in enumerate(objs):
+            ret = self.dict_class()
+            for attr_name, field in self.dump_fields.items():
+                if attr_name not in loaded:
+                    value = field.serialize(attr_name, item, accessor=self.get_attribute)
+                elif isinstance(field, _fields.Method):
+                    value = getattr(self, field.serialize_method_name)(
+                        item, loaded[attr_name][index])
+                else:
+                    value = field._serialize(  # pylint: disable=protected-access
+                        loaded[attr_name][index], attr_name, item)
+                if value is _missing:
+                    continue
+                ret[field.data_key if field.data_key is not None else attr_name] = value
+            result.append(ret)
+        return result if many else result[0]
+
+    def _run_loaders(self, objs):
+        """
+        Call the loader of every loader field once with the keys of all objs, concurrently if a
+        loader executor is configured. Return the loaded value of each object, by field name.
+        """
+        keys = {
+            name: [self.get_attribute(obj, field.metadata.get('loader_key', 'id'), None)
+                   for obj in objs]
+            for name, field in self._loader_fields.items()
+        }
+
+        def load(name):
+            """Resolve the distinct keys of a field, skipping the loader when there are none."""
+            distinct = [key for key in dict.fromkeys(keys[name]) if key is not None]
+            return self._loader_fields[name].metadata['loader'](distinct) if distinct else {}
+
+        executor = self.config.get('loader_executor')
+        if executor is not None and len(keys) > 1:
+            # Loaders may need the request and application contexts
+            futures = {
+                name: executor.submit(contextvars.copy_context().run, load, name) for name in keys}
+            results = {name: future.result() for name, future in futures.items()}
+        else:
+            results = {name: load(name) for name in keys}
+
+        return {
+            name: [None if key is None else results[name].get(key) for key in field_keys]
+            for name, field_keys in keys.items()
+        }
+
+    def _deserialize(self, data, *, error_store, many=False, partial=False, unknown=RAISE,
+                     index=None):
+        """Deserialize with the load functions generated for the schema, when configured to."""
+        if not self.config.get('compiled_load') or (partial is not False and partial is not None):
+            return super(BaseModelSchema, self)._deserialize(
+                data, error_store=error_store, many=many, partial=partial, unknown=unknown,
+                index=index)
+
+        compiled = self._compiled_loads.get(unknown)
+        if compiled is None:
+            compiled = self._compiled_loads.setdefault(unknown, compile_load(self, unknown))
+        load, load_many = compiled
+        if many:
+            if self.max_errors is not None:
+                # Items are then loaded one at a time, with the compiled load function
+                return super(BaseModelSchema, self)._deserialize(
+                    data, error_store=error_store, many=many, partial=partial, unknown=unknown,
+                    index=index)
+            return load_many(data, error_store, partial)
+        return load(data, error_store, index if self.opts.index_errors else None, partial)
+
+    def dump_attributes(self):
+        """Attributes read from models when serializing, in field declaration order."""
+        if self._dump_attributes is None:
+            attributes = {}
+            # Declaration order, since projections are built from unordered sets of fields
+            for name in self.declared_fields:
+                field = self.dump_fields.get(name)
+                if field is None:
+                    continue
+                if 'loader' in field.metadata:
+                    attributes[field.metadata.get('loader_key', 'id')] = None
+                    attributes.update(dict.fromkeys(field.metadata.get('requires', ())))
+                elif isinstance(field, (_fields.Method, _fields.Function)):
+                    attributes.update(dict.fromkeys(field.metadata['requires']))
+                else:
+                    attributes[field.attribute or name] = None
+            self._dump_attributes = tuple(attributes)
+        return self._dump_attributes
+
+    def _query_plan(self, params):
+        """Build the query plan for the loaded querystring."""
+        dumper = _REQUEST_STATE.get().dumper or self
+        attributes = dumper.dump_attributes()
+        fields = None if params['fields'] == '*' else split_fields(params['fields'])
+
+        order_by = params.get('order_by')
+        page, page_size, cursor = params.get('page'), params.get('page_size'), params.get('cursor')
+        offset = limit = None
+        if self.many and 'cursor' in self.context:
+            # Cursors are built from the last item of a page, so it needs the keyset attributes
+            order_by = self.context['order_by']
+            for name in (order_by, self.config.get('tiebreaker', 'id')):
+                name = self.declared_fields[name].attribute or name
+                if name not in attributes:
+                    attributes += (name,)
+            limit = page_size + 1
+        elif self.many and self.context.get('page'):
+            offset, limit = (page - 1) * page_size, page_size + 1
+
+        if order_by is not None:
+            order_by = self.declared_fields[order_by].attribute or order_by
+        return QueryPlan(attributes, fields, order_by, params.get('order'), page, page_size,
+                         cursor, offset, limit)
+
+    def _check_plan(self, plan, data):
+        """Check that models returned by a view hold every attribute the query plan lists."""
+        if self.many and is_columnar(data):
+            data = dict.fromkeys(column_names(data))
+        elif self.many:
+            # Lazy collections are not consumed to be checked
+            if not isinstance(data, (list, tuple)) or not data:
+                return
+            data = data[0]
+
+        names = [attribute.split('.')[0] for attribute in plan.attributes]
+        missing = [
+            name for name in names
+            if (name not in data if isinstance(data, dict) else not hasattr(data, name))
+        ]
+        if missing:
+            raise Exception(f'Attributes missing from the view result: {", ".join(missing)}.')
+
+    def _build_projection(self, requested):
+        """Build a schema instance that only serializes the requested fields."""
+        only = [
+            name for name, field in self.dump_fields.items()
+            if (field.data_key or name) in requested
+        ]
+        schema = type(self)(**{**self._init_kwargs, 'only': only, '_dump_only': True})
+        schema._state_owner = self  # pylint: disable=protected-access
+        schema.querystring_schema = self.querystring_schema
+        return schema
+
     def set_querystring_schema(self, **kwargs):
         """Configure querystring schema based on Meta options in model schema."""
 
+        # Querystring schemas hold no per-request state, so instances with equal options share one
+        many = bool(kwargs.get('many'))
+        key = (
+            many,
+            frozenset(self.exclude),
+            frozenset(self.load_only),
+            None if self.only is None else frozenset(self.only),
+        )
+        querystring_schemas = _QUERYSTRING_SCHEMAS.get(type(self))
+        if querystring_schemas is None:
+            querystring_schemas = _QUERYSTRING_SCHEMAS.setdefault(type(self), {})
+        self.querystring_schema = querystring_schemas.get(key)
+        if self.querystring_schema is not None:
+            return
+
         # Only use querystring collection schema if request is to a collection
         # and has a paged response (as informed by Meta class on schema)
         # Otherwise use querystring resource schema
-        many = kwargs.get('many')
         querystring_schema = None
 
         if many:
@@ -153,19 +1280,33 @@ class BaseModelSchema(ErrorHandlingSchema):
             querystring_schema = self.config['querystring_schemas']['load']
             self.querystring_schema = querystring_schema()
 
-        self.querystring_schema.allowed_fields = {
+        self.querystring_schema.allowed_fields = frozenset(
             field.data_key or field.name for field in self.fields.values()
-        } - set(self.exclude) - set(self.load_only)
+        ) - set(self.exclude) - set(self.load_only)
+        self.querystring_schema.max_errors = self.config.get('max_errors')
+        if isinstance(self.querystring_schema, CursorQuerystringCollection):
+            self.querystring_schema.tiebreaker = self.config.get('tiebreaker', 'id')
+            self.querystring_schema.cursor_fields = self.declared_fields
+        self.querystring_schema = querystring_schemas.setdefault(key, self.querystring_schema)
 
     # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
     @pre_dump(pass_many=True)
     def pre_dump_func(self, data, many):
         """
-        Set the last modified value for resources at the global level for use
-        in constructing headers later.
+        Set the last modified value for resources (or the most recent one of a page of
+        resources) at the global level for use in constructing headers later.
         """
+        state = self._request_state()
+        if (many and data is not None and is_columnar(data)) or \
+                (state is not None and state.streaming):
+            # Chunks of streamed or parallel dumps are not the whole page
+            return data
         if data and not many and hasattr(data, 'updated_dt'):
             g.last_modified = data.updated_dt or getattr(data, 'created_dt', None)
+        elif data and many:
+            modified = last_modified(data)
+            if modified is not None:
+                g.last_modified = modified
         return data
 
     @pre_load(pass_many=True)
@@ -174,9 +1315,16 @@ class BaseModelSchema(ErrorHandlingSchema):
         if data:
             if request.headers.get('Content-Type', '').startswith('application/json'):
                 try:
-                    data = json.loads(data)
-                except json.JSONDecodeError:
+                    data = self.json_codec.loads(data)
+                except self.json_codec.decode_errors:
                     raise BadRequest(message='Invalid json data')
+            elif request.headers.get('Content-Type', '').startswith(MSGPACK_MIMETYPES):
+                if self.msgpack_codec is None:
+                    raise APIException(415, message='MessagePack is not supported.')
+                try:
+                    data = self.msgpack_codec.loads(data)
+                except self.msgpack_codec.decode_errors:
+                    raise BadRequest(message='Invalid msgpack data')
             elif request.headers.get('Content-Type', '').startswith(  # pragma: no branch
                     'application/octet-stream'):
                 transformer = self.config['protobuffers']['load_many'] if self.many \
@@ -187,54 +1335,67 @@ class BaseModelSchema(ErrorHandlingSchema):
                     raise BadRequest(message='Invalid protocol buffer data')
         else:
             data = [] if many else {}
+
+        # Reject oversized collections before validating any of their items
+        max_items = self.config.get('max_items')
+        if many and max_items is not None and is_collection(data) and len(data) > max_items:
+            raise APIException(413, message='Too many items.')
         return data
 
     # pylint: disable=unexpected-keyword-arg,no-value-for-parameter
     @post_dump(pass_many=True)
     def post_dump_func(self, data, many, **kwargs):
         """Format response depending on whether it is a resource or collection."""
+        state = self._request_state()
+        if state is not None and state.streaming:
+            # Streamed collections are enveloped and encoded item by item
+            return data
+
         def handle_collections(data):
             """Format response according to whether its a collection or resource request."""
             if data and many:
-                if 'page' in self.context:  # pragma: no branch
-                    page = self.context['page']
-                    page_size = self.context['page_size']
+                if 'page' in self.context:
+                    data = {
+                        'data': data,
+                        'page_size': self.context['page_size'],
+                        'next_page': bool(state and state.next_page)
+                    }
+                elif 'cursor' in self.context:
                     data = {
-                        'data': data[:page_size if page else None],
-                        'page_size': page_size,
-                        'next_page': bool(len(data) >= page_size + 1 and page)
+                        'data': data,
+                        'page_size': self.context['page_size'],
+                        'next_cursor': state.next_cursor if state is not None else None
                     }
                 else:
                     data = {'data': data}
             return data
 
-        def handle_fields(data):
-            """Trim response fields down to requested fields."""
-            if data:
-                to_trim = data["data"] if many else [data]
-                if self.only:
-                    for entry in to_trim:
-                        for key in set(entry.keys()) - set(self.only):
-                            del entry[key]
-            return data
-
         def handle_empty(data):
             """Handle data that is falsey."""
             return data or ''
 
         def process_for_mimetype(data):
             """Serialize data per client mimetype request."""
+            start = state.start() if state is not None else None
             if data:
                 if request.headers.get("Accept", "application/json") == 'application/json':
-                    data = json.dumps(data)
+                    data = self.json_codec.dumps(data)
+                elif request.headers.get("Accept") in MSGPACK_MIMETYPES:
+                    if self.msgpack_codec is None:
+                        raise APIException(406, message='MessagePack is not supported.')
+                    data = self.msgpack_codec.dumps(data)
                 elif request.headers.get("Accept") == \
                         'application/octet-stream':  # pragma: no branch
                     transformer = self.config['protobuffers']['dump_many'] if many \
                         else self.config['protobuffers']['dump']
                     data = transformer.dict_to_message(data).SerializeToString()
+            if start is not None:
+                state.record('encode', start, size=len(data))
             return data
 
-        return process_for_mimetype(handle_empty(handle_fields(handle_collections(data))))
+        if state is not None and state.dump_start is not None:
+            state.record('dump', state.dump_start, len(data) if many else int(bool(data)))
+        return process_for_mimetype(handle_empty(handle_collections(data)))
 
     @post_load
     def post_load_func(self, data, **kwargs):
@@ -246,38 +1407,31 @@ class QuerystringResource(ErrorHandlingSchema):
     """Schema for resource querystrings."""
 
     fields = _fields.Str(missing='*')
-    allowed_fields = ()
+    allowed_fields = frozenset()
+    querystring_plan = None
 
     @validates('fields')
     def validate_fields(self, data):
         """Validate fields."""
         if data != '*':
-            requested_fields = data.split(',')
-            for field in requested_fields:
+            for field in split_fields(data):
                 if field not in self.allowed_fields:
                     raise ValidationError('Invalid field: {}'.format(field))
 
     @pre_load
     def parse_querystring(self, args, **kwargs):
         """Parse arguments from querystring and validate that there aren't any extra args."""
-        args, args_lists = args
-
-        args = dict(args)
-        args_lists = dict(args_lists)
-        data = copy.deepcopy(args)
+        plan = self.querystring_plan
+        if plan is None:
+            field_names = frozenset(field.data_key or field.name for field in self.fields.values())
+            plan = _QUERYSTRING_PLANS.get((type(self), field_names))
+            if plan is None:
+                plan = _QUERYSTRING_PLANS.setdefault(
+                    (type(self), field_names), QuerystringPlan(field_names))
+            self.querystring_plan = plan
 
-        for key in args:
-            if key.endswith('[]'):
-                del data[key]
-                data[key[:-2]] = args_lists[key]
-
-        field_names = {field.data_key or field.name for field in self.fields.values()}
-
-        for key in data.keys():
-            if key not in field_names:
-                raise ValidationError(f'{key} is an invalid querystring argument.')
-
-        return data
+        # Querystrings used to be loaded as an (items, lists) pair, which is still accepted
+        return plan.parse(args[1] if isinstance(args, tuple) else args.lists())
 
 
 class UnpagedQuerystringCollection(QuerystringResource):
@@ -340,8 +1494,7 @@ class QuerystringCollection(UnpagedQuerystringCollection):
 
         if data['page'] == '*':
             if not unconditional_paging:
-                fields = data['fields'].split(',')
-                if data['fields'] == '*' or len(fields) > 2:
+                if data['fields'] == '*' or len(split_fields(data['fields'])) > 2:
                     raise ValidationError('Maximum two fields allowed for page=*.')
 
     @post_load
@@ -349,3 +1502,37 @@ class QuerystringCollection(UnpagedQuerystringCollection):
         """Cast page to an int (while handling '*')."""
         data['page'] = None if data['page'] == '*' else int(data['page'])
         return data
+
+
+class CursorQuerystringCollection(UnpagedQuerystringCollection):
+    """
+    Schema for collection querystrings paged by keyset: `cursor` encodes the `order_by` and
+    tiebreaker values of the last item of the previous page, so deep pages cost the same as the
+    first one and the page number is not capped.
+    """
+
+    cursor = _fields.Str(missing=None)
+    page_size = _fields.Int(missing=MAX_PAGE_SIZE,
+                            validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+    tiebreaker = 'id'
+    cursor_fields = None
+
+    @post_load
+    def load_cursor(self, data, **kwargs):
+        """Decode the cursor to a Keyset, checking that it was issued for the requested order."""
+        if data['cursor'] is not None:
+            order_by = data.get('order_by', self.tiebreaker)
+            try:
+                cursor_order_by, order, value, tiebreaker = decode_cursor(data['cursor'])
+                if (cursor_order_by, order) != (order_by, data.get('order', 'asc')):
+                    raise ValueError('Cursor issued for another order.')
+                data['cursor'] = Keyset(
+                    self._deserialize_value(order_by, value),
+                    self._deserialize_value(self.tiebreaker, tiebreaker))
+            except (TypeError, ValueError, ValidationError):
+                raise ValidationError('Not a valid cursor.', 'cursor')
+        return data
+
+    def _deserialize_value(self, name, value):
+        """Load a keyset value with the model schema field it was dumped with."""
+        return None if value is None else self.cursor_fields[name].deserialize(value)
@@ -0,0 +1,125 @@
+"""Response cache backends."""
+import collections
+import threading
+import time
+
+
+class CachedResponse(object):
+    """
+    A serialized response stored in a response cache, along with its body compressed with each
+    content coding (such as 'gzip') it has been sent with.
+    """
+
+    __slots__ = ('body', 'etag', 'last_modified', 'compressed')
+
+    def __init__(self, body, etag=None, last_modified=None, compressed=None):
+        """Store the serialized body returned by a decorated view and its validators."""
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.compressed = {} if compressed is None else compressed
+
+
+class BaseCache(object):
+    """
+    Interface for response cache backends.
+
+    Keys are strings prefixed with the namespace of the decorated view they belong to (followed
+    by ':'), so that backends shared between processes can store them as they are. Values are
+    `CachedResponse` instances, or the serialized objects of a fragment cache; shared backends are
+    responsible for serializing them.
+    """
+
+    def get(self, key):
+        """Return the value stored for key, or None if it is missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """Store value for key for ttl seconds."""
+        raise NotImplementedError
+
+    def invalidate(self, namespace):
+        """Drop every value stored under namespace."""
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        """Return a dictionary of the values stored for keys, leaving out missing ones."""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, values, ttl):
+        """Store every value of a dictionary for its key for ttl seconds."""
+        for key, value in values.items():
+            self.set(key, value, ttl)
+
+
+class MemoryCache(BaseCache):
+    """In-process cache holding at most maxsize values, evicting the least recently used."""
+
+    def __init__(self, maxsize=1024):
+        """Create an empty cache."""
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value stored for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store value for key for ttl seconds."""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_many(self, keys):
+        """Return a dictionary of the values stored for keys, leaving out missing ones."""
+        values = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[1] <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                values[key] = entry[0]
+        return values
+
+    def set_many(self, values, ttl):
+        """Store every value of a dictionary for its key for ttl seconds."""
+        expires = time.monotonic() + ttl
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace):
+        """Drop every value stored under namespace."""
+        prefix = namespace + ':'
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def __len__(self):
+        """Number of values currently stored, including expired ones not yet dropped."""
+        return len(self._entries)
@@ -0,0 +1,147 @@
+"""JSON and MessagePack encoder/decoder backends."""
+import importlib
+import json
+
+
+class JSONCodec(object):
+    """JSON backend built on the standard library."""
+
+    name = 'json'
+    # Every supported backend raises a subclass of ValueError for malformed input
+    decode_errors = (ValueError,)
+    # Whether dumps returns bytes rather than str
+    binary = False
+
+    def dumps(self, data):
+        """Encode data to JSON in whichever of str or bytes is cheapest for the backend."""
+        return json.dumps(data)
+
+    def dumps_bytes(self, data):
+        """Encode data to JSON bytes."""
+        return json.dumps(data).encode('utf-8')
+
+    def loads(self, data):
+        """Decode JSON str or bytes."""
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """JSON backend built on orjson, which encodes straight to bytes."""
+
+    name = 'orjson'
+    binary = True
+
+    def __init__(self, module):
+        """Keep a reference to the imported backend module."""
+        self._module = module
+        self._option = module.OPT_NON_STR_KEYS
+
+    def dumps(self, data):
+        """Encode data to JSON bytes."""
+        return self._module.dumps(data, option=self._option)
+
+    dumps_bytes = dumps
+
+    def loads(self, data):
+        """Decode JSON str or bytes."""
+        return self._module.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """JSON backend built on ujson."""
+
+    name = 'ujson'
+
+    def __init__(self, module):
+        """Keep a reference to the imported backend module."""
+        self._module = module
+
+    def dumps(self, data):
+        """Encode data to a JSON string."""
+        return self._module.dumps(data, escape_forward_slashes=False)
+
+    def dumps_bytes(self, data):
+        """Encode data to JSON bytes."""
+        return self.dumps(data).encode('utf-8')
+
+    def loads(self, data):
+        """Decode JSON str or bytes."""
+        return self._module.loads(data)
+
+
+class RapidjsonCodec(UjsonCodec):
+    """JSON backend built on python-rapidjson."""
+
+    name = 'rapidjson'
+
+    def dumps(self, data):
+        """Encode data to a JSON string."""
+        return self._module.dumps(data)
+
+
+# Optional backends, in order of preference for 'auto'
+_BACKENDS = {
+    'orjson': OrjsonCodec,
+    'rapidjson': RapidjsonCodec,
+    'ujson': UjsonCodec,
+}
+_CODECS = {'json': JSONCodec()}
+
+
+class MsgpackCodec(object):
+    """MessagePack backend built on msgpack, which encodes straight to bytes."""
+
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self, module):
+        """Keep a reference to the imported backend module."""
+        self._module = module
+        # Truncated and malformed input raise ValueError subclasses, other unpacking errors don't
+        self.decode_errors = (ValueError, module.UnpackException)
+
+    def dumps(self, data):
+        """Encode data to MessagePack bytes."""
+        return self._module.packb(data)
+
+    dumps_bytes = dumps
+
+    def loads(self, data):
+        """Decode MessagePack bytes."""
+        return self._module.unpackb(data)
+
+
+def get_codec(name):
+    """
+    Return the codec for a backend name ('json', 'orjson', 'rapidjson', 'ujson' or 'auto'),
+    falling back to the standard library when the requested backend is not installed.
+    """
+    if name in _CODECS:
+        return _CODECS[name]
+
+    if name == 'auto':
+        names = list(_BACKENDS)
+    elif name in _BACKENDS:
+        names = [name]
+    else:
+        raise Exception(f'Unknown JSON backend "{name}".')
+
+    codec = _CODECS['json']
+    for backend in names:
+        try:
+            codec = _BACKENDS[backend](importlib.import_module(backend))
+            break
+        except ImportError:
+            continue
+
+    return _CODECS.setdefault(name, codec)
+
+
+def get_msgpack_codec():
+    """Return the MessagePack codec, or None if msgpack is not installed."""
+    if 'msgpack' not in _CODECS:
+        try:
+            _CODECS['msgpack'] = MsgpackCodec(importlib.import_module('msgpack'))
+        except ImportError:
+            _CODECS['msgpack'] = None
+    return _CODECS['msgpack']
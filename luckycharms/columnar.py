@@ -0,0 +1,155 @@
+"""
+Column at a time serialization of columnar collections: mappings of column names to sequences
+(such as lists or NumPy arrays), NumPy structured arrays and pandas DataFrames.
+
+A columnar collection serializes to the same items as a list holding a dictionary for each of its
+rows. Columns of Int, Float, Str and Bool fields held in NumPy arrays are converted with vectorized
+casts, other columns of primitive fields value by value, and any other field is serialized by
+marshmallow from the rows. NumPy and pandas are not required: collections are only recognized as
+arrays or DataFrames when the library that built them has been imported.
+"""
+import sys
+from collections.abc import Mapping
+
+from marshmallow import fields
+from marshmallow.utils import missing
+
+# Fields serializing values without looking at the object they were read from
+_COLUMN_FIELDS = frozenset((
+    fields.Integer, fields.Float, fields.Decimal, fields.String, fields.UUID, fields.Boolean,
+    fields.DateTime, fields.Date, fields.Time, fields.Raw,
+))
+
+
+def _is_dataframe(data):
+    """Whether data is a pandas DataFrame."""
+    pandas = sys.modules.get('pandas')
+    return pandas is not None and isinstance(data, pandas.DataFrame)
+
+
+def _is_array(column):
+    """Whether column is a NumPy array."""
+    numpy = sys.modules.get('numpy')
+    return numpy is not None and isinstance(column, numpy.ndarray)
+
+
+def is_columnar(data):
+    """Whether a collection holds columns rather than items."""
+    if isinstance(data, Mapping) or _is_dataframe(data):
+        return True
+    return _is_array(data) and data.dtype.names is not None
+
+
+def column_names(data):
+    """Names of the columns of a columnar collection."""
+    if isinstance(data, Mapping):
+        return list(data)
+    if _is_dataframe(data):
+        return list(data.columns)
+    return list(data.dtype.names)
+
+
+def column_length(data):
+    """Number of rows of a columnar collection."""
+    if isinstance(data, Mapping):
+        return len(next(iter(data.values()), ()))
+    return len(data)
+
+
+def column_slice(data, start, stop):
+    """Rows start to stop of a columnar collection, as a collection of the same kind."""
+    if isinstance(data, Mapping):
+        return {name: column[start:stop] for name, column in data.items()}
+    if _is_dataframe(data):
+        return data.iloc[start:stop]
+    return data[start:stop]
+
+
+def column_values(data, name):
+    """Values of a column as a list of Python objects (as pandas converts them, for DataFrames)."""
+    column = data[name]
+    return column.tolist() if hasattr(column, 'tolist') else list(column)
+
+
+def column_rows(data):
+    """A dictionary for each row of a columnar collection."""
+    names = column_names(data)
+    columns = [column_values(data, name) for name in names]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def _vectorized(field, column):
+    """Serialize a NumPy column of an Int, Float, Str or Bool field with a cast, if it can be."""
+    kind = column.dtype.kind
+    field_class = type(field)
+    if field_class is fields.Integer and not field.as_string:
+        if kind in 'iu':
+            return column.tolist()
+        if kind == 'b':
+            return column.astype('int64').tolist()
+    elif field_class is fields.Float and not field.as_string:
+        if kind == 'f':
+            return column.tolist()
+        if kind in 'iub':
+            return column.astype('float64').tolist()
+    elif (field_class is fields.String and kind == 'U') or \
+            (field_class is fields.Boolean and kind == 'b'):
+        return column.tolist()
+    return None
+
+
+def _column(data, name):
+    """A column as a NumPy array (or list, for mappings of lists), or None if it is missing."""
+    if isinstance(data, Mapping):
+        return data.get(name)
+    if _is_dataframe(data):
+        return data[name].to_numpy() if name in data.columns else None
+    return data[name] if name in data.dtype.names else None
+
+
+def serialize_columns(schema, data):
+    """Serialize a columnar collection to a list of dictionaries, a field at a time."""
+    length = column_length(data)
+    keys = []
+    columns = []
+    sparse = []
+    rows = None
+    for attr_name, field in schema.dump_fields.items():
+        key = field.data_key if field.data_key is not None else attr_name
+        attribute = field.attribute if field.attribute is not None else attr_name
+        if type(field) in _COLUMN_FIELDS and '.' not in attribute:
+            column = _column(data, attribute)
+            if column is None:
+                if field.default is missing:
+                    continue
+                default = field.default
+                values = [
+                    field._serialize(  # pylint: disable=protected-access
+                        default() if callable(default) else default, attr_name, None)
+                    for _ in range(length)
+                ]
+            else:
+                values = _vectorized(field, column) if _is_array(column) else None
+                if values is None:
+                    values = [
+                        field._serialize(value, attr_name, None)  # pylint: disable=protected-access
+                        for value in column_values(data, attribute)
+                    ]
+        else:
+            if rows is None:
+                rows = column_rows(data)
+            values = [
+                field.serialize(attr_name, row, accessor=schema.get_attribute) for row in rows]
+            if any(value is missing for value in values):
+                sparse.append(key)
+        keys.append(key)
+        columns.append(values)
+
+    dict_class = schema.dict_class
+    result = [dict_class(zip(keys, values)) for values in zip(*columns)] if columns else \
+        [dict_class() for _ in range(length)]
+    for key in sparse:
+        for item in result:
+            if item[key] is missing:
+                del item[key]
+    return result
@@ -0,0 +1,354 @@
+"""
+Dump and load functions generated for a schema's fields, equivalent to marshmallow's
+`Schema._serialize` and `Schema._deserialize`.
+
+Dumping inlines attribute access and the serializers of Int, Float, Str, Bool, DateTime, Raw and
+Lists of those fields; any other field is serialized by marshmallow. Loading inlines the
+conversion and the Range and Length validation of valid Int, Float, Str, Bool, Raw and List values,
+and the OneOf validation of Int, Float, Str and Bool values; other values (including every invalid
+one, so that errors are unchanged) are deserialized by marshmallow.
+"""
+import functools
+from collections.abc import Mapping
+
+from marshmallow import EXCLUDE, INCLUDE, Schema, ValidationError, fields, validate
+from marshmallow.utils import (
+    _get_value_for_key,
+    ensure_text_type,
+    get_value,
+    is_collection,
+    missing,
+    set_value,
+)
+
+# Fields whose loaded values are hashable, so OneOf can look them up in its choices
+_HASHABLE_FIELDS = (fields.Integer, fields.Float, fields.String, fields.Boolean)
+
+
+def _text(value):
+    """Serialize a String field value other than a str."""
+    return None if value is None else ensure_text_type(value)
+
+
+def _value_expression(field, value, namespace, depth=0):
+    """
+    Return an expression serializing the value named `value` for field, adding the objects it
+    refers to to namespace, or None when the field has to be serialized by marshmallow.
+    """
+    field_type = type(field)
+    prefix = f'_f{len(namespace)}'
+
+    if field_type in (fields.Integer, fields.Float):
+        convert = field_type.num_type.__name__
+        if field.as_string:
+            return f'(None if {value} is None else str({convert}({value})))'
+        return f'({value} if {value}.__class__ is {convert} else ' \
+            f'None if {value} is None else {convert}({value}))'
+
+    if field_type is fields.String:
+        namespace['_text'] = _text
+        return f'({value} if {value}.__class__ is str else _text({value}))'
+
+    if field_type is fields.Boolean:
+        namespace[f'{prefix}_truthy'] = field.truthy
+        namespace[f'{prefix}_falsy'] = field.falsy
+        return f'(None if {value} is None else True if {value} in {prefix}_truthy else ' \
+            f'False if {value} in {prefix}_falsy else bool({value}))'
+
+    if field_type is fields.DateTime:
+        data_format = field.format or field.DEFAULT_FORMAT
+        namespace[f'{prefix}_format'] = field.SERIALIZATION_FUNCS.get(data_format) or \
+            (lambda dt: dt.strftime(data_format))
+        return f'(None if {value} is None else {prefix}_format({value}))'
+
+    if field_type is fields.Raw:
+        return value
+
+    if field_type is fields.List:
+        item = f'_item{depth}'
+        inner = _value_expression(field.inner, item, namespace, depth + 1)
+        if inner is None:
+            return None
+        return f'(None if {value} is None else [{inner} for {item} in {value}])'
+
+    return None
+
+
+def _body(schema, namespace):
+    """Return the statements that serialize `obj` to `ret`, one indentation level deep."""
+    planned = []
+    for index, (attr_name, field) in enumerate(schema.dump_fields.items()):
+        key = field.data_key if field.data_key is not None else attr_name
+        expression = None
+        if field._CHECK_ATTRIBUTE and type(field).get_value is fields.Field.get_value:
+            expression = _value_expression(field, f'_v{index}', namespace)
+        if expression is None:
+            namespace[f'_field{index}'] = field
+        planned.append((index, attr_name, field, key, expression))
+
+    # Values are fetched the way marshmallow.utils.get_value does, specialized for dicts and for
+    # objects without __getitem__
+    fetch = {'dict': [], 'object': [], 'other': []}
+    for index, attr_name, field, key, expression in planned:
+        if expression is None:
+            continue
+        attribute = field.attribute if field.attribute is not None else attr_name
+        if '.' in attribute:
+            statement = f'_v{index} = _get_value(obj, {attribute!r}, _missing)'
+            for statements in fetch.values():
+                statements.append(statement)
+            continue
+        fetch['dict'].append(f'_v{index} = obj.get({attribute!r}, _missing)')
+        fetch['dict'].append(
+            f'if _v{index} is _missing: _v{index} = getattr(obj, {attribute!r}, _missing)')
+        fetch['object'].append(f'_v{index} = getattr(obj, {attribute!r}, _missing)')
+        fetch['other'].append(f'_v{index} = _value_for_key(obj, {attribute!r}, _missing)')
+
+    lines = []
+    if fetch['dict']:
+        lines.append('if obj.__class__ is dict:')
+        lines.extend('    ' + statement for statement in fetch['dict'])
+        lines.append("elif not hasattr(obj, '__getitem__'):")
+        lines.extend('    ' + statement for statement in fetch['object'])
+        lines.append('else:')
+        lines.extend('    ' + statement for statement in fetch['other'])
+
+    lines.append('ret = _dict_class()' if schema.dict_class is not dict else 'ret = {}')
+    for index, attr_name, field, key, expression in planned:
+        if expression is None:
+            lines.append(
+                f'_v{index} = _field{index}.serialize({attr_name!r}, obj, accessor=_accessor)')
+            lines.append(f'if _v{index} is not _missing: ret[{key!r}] = _v{index}')
+            continue
+
+        if field.default is not missing:
+            namespace[f'_default{index}'] = field.default
+            if callable(field.default):
+                lines.append(f'if _v{index} is _missing: _v{index} = _default{index}()')
+            else:
+                lines.append(f'if _v{index} is _missing: _v{index} = _default{index}')
+        lines.append(f'if _v{index} is not _missing: ret[{key!r}] = {expression}')
+    return lines
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(source):
+    """Compile generated source, once for every schema class (and projection) it was built for."""
+    return compile(source, '<luckycharms>', 'exec')
+
+
+def compile_dump(schema):
+    """
+    Return (dump, dump_many) functions serializing one object or an iterable of objects exactly
+    as `schema._serialize` does, or None when the schema reads attributes in its own way.
+    """
+    if type(schema).get_attribute is not Schema.get_attribute:
+        return None
+
+    namespace = {
+        '_missing': missing,
+        '_get_value': get_value,
+        '_value_for_key': _get_value_for_key,
+        '_dict_class': schema.dict_class,
+        '_accessor': schema.get_attribute,
+    }
+    body = _body(schema, namespace)
+    source = '\n'.join([
+        'def dump(obj):',
+        *('    ' + line for line in body),
+        '    return ret',
+        '',
+        'def dump_many(objs):',
+        '    result = []',
+        '    append = result.append',
+        '    for obj in objs:',
+        *('        ' + line for line in body),
+        '        append(ret)',
+        '    return result',
+    ])
+    exec(_compile(source), namespace)  # pylint: disable=exec-used
+    return namespace['dump'], namespace['dump_many']
+
+
+def _load_field(field, value, field_name, attribute, data, ret, error_store, index, partial):
+    """Deserialize a value with marshmallow, storing errors as `Schema._deserialize` does."""
+    try:
+        value = field.deserialize(value, field_name, data, partial=partial)
+    except ValidationError as error:
+        error_store.store_error(error.messages, field_name, index=index)
+        value = error.valid_data or missing
+    if value is not missing:
+        set_value(ret, attribute, value)
+
+
+def _load_expression(field, value, depth=0):
+    """
+    Return (condition, expression) where expression deserializes the value named `value` for
+    field whenever condition holds, or None when the field's values are loaded by marshmallow.
+    """
+    field_type = type(field)
+
+    if field_type is fields.Integer:
+        return f'{value}.__class__ is int', value
+
+    if field_type is fields.Float:
+        # Infinity and NaN give NaN when subtracted from themselves
+        condition = f'{value}.__class__ is float'
+        if not field.allow_nan:
+            condition = f'({condition} and {value} - {value} == 0)'
+        return f'({condition} or {value}.__class__ is int and ' \
+            f'-9007199254740992 <= {value} <= 9007199254740992)', f'float({value})'
+
+    if field_type is fields.String:
+        return f'{value}.__class__ is str', value
+
+    if field_type is fields.Boolean:
+        if True in field.truthy and False in field.falsy and False not in field.truthy:
+            return f'({value} is True or {value} is False)', value
+        return None
+
+    if field_type is fields.Raw:
+        return f'{value} is not None', value
+
+    if field_type is fields.List and not field.inner.validators:
+        item = f'_item{depth}'
+        inner = _load_expression(field.inner, item, depth + 1)
+        if inner is None:
+            return None
+        condition = f'({value}.__class__ is list and all({inner[0]} for {item} in {value}))'
+        if inner[1] == item:
+            return condition, f'list({value})'
+        return condition, f'[{inner[1]} for {item} in {value}]'
+
+    return None
+
+
+def _validation_condition(field, value, namespace, index):
+    """Return a condition under which every validator of field passes, or None if unknown."""
+    conditions = []
+    for position, validator in enumerate(field.validators):
+        name = f'_validator{index}_{position}'
+        validator_type = type(validator)
+        if validator_type is validate.Range:
+            if validator.min is not None:
+                namespace[f'{name}_min'] = validator.min
+                operator = '>=' if validator.min_inclusive else '>'
+                conditions.append(f'{value} {operator} {name}_min')
+            if validator.max is not None:
+                namespace[f'{name}_max'] = validator.max
+                operator = '<=' if validator.max_inclusive else '<'
+                conditions.append(f'{value} {operator} {name}_max')
+        elif validator_type is validate.Length:
+            if validator.equal is not None:
+                conditions.append(f'len({value}) == {validator.equal!r}')
+                continue
+            if validator.min is not None:
+                conditions.append(f'len({value}) >= {validator.min!r}')
+            if validator.max is not None:
+                conditions.append(f'len({value}) <= {validator.max!r}')
+        elif validator_type is validate.OneOf and type(field) in _HASHABLE_FIELDS:
+            namespace[f'{name}_choices'] = validator.choices
+            conditions.append(f'{value} in {name}_choices')
+        else:
+            return None
+    return ' and '.join(conditions) or 'True'
+
+
+def _load_body(schema, unknown, namespace):
+    """Return the statements that deserialize `data` to `ret`, storing errors at `index`."""
+    namespace['_type_error'] = [schema.error_messages['type']]
+    namespace['_unknown_error'] = [schema.error_messages['unknown']]
+    lines = [
+        'ret = _dict_class()',
+        'if data.__class__ is not dict and not isinstance(data, _Mapping):',
+        '    error_store.store_error(_type_error, index=index)',
+        'else:',
+    ]
+
+    load_keys = set()
+    for index, (attr_name, field) in enumerate(schema.load_fields.items()):
+        key = field.data_key if field.data_key is not None else attr_name
+        attribute = field.attribute or attr_name
+        load_keys.add(key)
+        namespace[f'_field{index}'] = field
+        store = f'ret[{attribute!r}] = {{}}' if '.' not in attribute \
+            else f'_set_value(ret, {attribute!r}, {{}})'
+        slow = f'_load_field(_field{index}, _r, {key!r}, {attribute!r}, data, ret, ' \
+            f'error_store, index, partial)'
+
+        lines.append(f'    _r = data.get({key!r}, _missing)')
+        lines.append('    if _r is _missing:')
+        if field.required:
+            lines.append(f'        {slow}')
+        else:
+            namespace[f'_missing{index}'] = field.missing
+            value = f'_missing{index}()' if callable(field.missing) else f'_missing{index}'
+            if field.missing is not missing:
+                lines.append(f'        {store.format(value)}')
+            else:
+                lines.append('        pass')
+        if field.allow_none:
+            lines.append('    elif _r is None:')
+            lines.append(f'        {store.format("None")}')
+
+        loaded = _load_expression(field, '_r')
+        validation = _validation_condition(field, '_o', namespace, index)
+        if loaded is not None and validation is not None:
+            condition, expression = loaded
+            lines.append(f'    elif {condition}:')
+            lines.append(f'        _o = {expression}')
+            if validation == 'True':
+                lines.append(f'        {store.format("_o")}')
+            else:
+                lines.append(f'        if {validation}:')
+                lines.append(f'            {store.format("_o")}')
+                lines.append('        else:')
+                lines.append(f'            {slow}')
+        lines.append('    else:')
+        lines.append(f'        {slow}')
+
+    namespace['_load_keys'] = frozenset(load_keys)
+    if unknown != EXCLUDE:
+        lines.append('    if not _load_keys.issuperset(data):')
+        lines.append('        for _key in set(data) - _load_keys:')
+        if unknown == INCLUDE:
+            lines.append('            _set_value(ret, _key, data[_key])')
+        else:
+            lines.append('            error_store.store_error(_unknown_error, _key, index)')
+    return lines
+
+
+def compile_load(schema, unknown):
+    """
+    Return (load, load_many) functions deserializing one item or a collection of items exactly
+    as `schema._deserialize` does (without partial loading) for the given unknown option.
+    """
+    namespace = {
+        '_missing': missing,
+        '_Mapping': Mapping,
+        '_set_value': set_value,
+        '_load_field': _load_field,
+        '_dict_class': schema.dict_class,
+    }
+    body = _load_body(schema, unknown, namespace)
+    index_errors = 'index' if schema.opts.index_errors else 'None'
+    source = '\n'.join([
+        'def load(data, error_store, index, partial):',
+        *('    ' + line for line in body),
+        '    return ret',
+        '',
+        'def load_many(items, error_store, partial):',
+        '    if not _is_collection(items):',
+        '        error_store.store_error(_type_error)',
+        '        return []',
+        '    result = []',
+        '    append = result.append',
+        '    for index, data in enumerate(items):',
+        f'        index = {index_errors}',
+        *('        ' + line for line in body),
+        '        append(ret)',
+        '    return result',
+    ])
+    namespace['_is_collection'] = is_collection
+    exec(_compile(source), namespace)  # pylint: disable=exec-used
+    return namespace['load'], namespace['load_many']
@@ -0,0 +1,91 @@
+"""Response compression backends, named after the content codings they produce."""
+import importlib
+import zlib
+
+
+class GzipEncoding(object):
+    """gzip content coding built on the standard library."""
+
+    name = 'gzip'
+    level = 6
+
+    def compress(self, data):
+        """Compress a whole body."""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_chunks(self, chunks):
+        """Compress an iterable of chunks, flushing each one so that clients can decode it."""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+class BrotliEncoding(object):
+    """br content coding built on brotli."""
+
+    name = 'br'
+    # Higher qualities are too slow for responses compressed on the fly
+    level = 4
+
+    def __init__(self, module):
+        """Keep a reference to the imported backend module."""
+        self._module = module
+
+    def compress(self, data):
+        """Compress a whole body."""
+        return self._module.compress(data, quality=self.level)
+
+    def compress_chunks(self, chunks):
+        """Compress an iterable of chunks, flushing each one so that clients can decode it."""
+        compressor = self._module.Compressor(quality=self.level)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+
+
+class ZstdEncoding(BrotliEncoding):
+    """zstd content coding built on zstandard."""
+
+    name = 'zstd'
+    level = 3
+
+    def compress(self, data):
+        """Compress a whole body."""
+        # Compressors are not thread safe, so they aren't shared between requests
+        return self._module.ZstdCompressor(level=self.level).compress(data)
+
+    def compress_chunks(self, chunks):
+        """Compress an iterable of chunks, flushing each one so that clients can decode it."""
+        compressor = self._module.ZstdCompressor(level=self.level).compressobj()
+        for chunk in chunks:
+            yield compressor.compress(chunk) + \
+                compressor.flush(self._module.COMPRESSOBJ_FLUSH_BLOCK)
+        yield compressor.flush()
+
+
+# Content codings, with the module their backend requires
+_BACKENDS = {
+    'br': (BrotliEncoding, 'brotli'),
+    'zstd': (ZstdEncoding, 'zstandard'),
+}
+_ENCODINGS = {'gzip': GzipEncoding()}
+
+
+def get_encoding(name):
+    """
+    Return the compression backend for a content coding ('br', 'zstd' or 'gzip'), or None if
+    the library it requires is not installed.
+    """
+    if name in _ENCODINGS:
+        return _ENCODINGS[name]
+    if name not in _BACKENDS:
+        raise Exception(f'Unknown content coding "{name}".')
+
+    encoding_class, module = _BACKENDS[name]
+    try:
+        encoding = encoding_class(importlib.import_module(module))
+    except ImportError:
+        encoding = None
+    return _ENCODINGS.setdefault(name, encoding)
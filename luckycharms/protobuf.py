@@ -0,0 +1,273 @@
+"""
+Protocol buffer transformers that map dictionaries to and from messages using their descriptors.
+
+Requires the 'proto' extra (for example, pip install luckycharms[proto]).
+"""
+import base64
+
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.json_format import ParseError
+
+# Field converters, computed once per message type
+_CONVERTERS = {}
+
+# Well known types that have a JSON string representation (Timestamp, Duration, FieldMask)
+_JSON_STRING_TYPES = (
+    'google.protobuf.Timestamp',
+    'google.protobuf.Duration',
+    'google.protobuf.FieldMask',
+)
+
+
+def _scalar_setter(field):
+    """Build a function converting a dictionary value for a scalar field."""
+    if field.type == FieldDescriptor.TYPE_ENUM:
+        values_by_name = field.enum_type.values_by_name
+
+        def convert(value):
+            """Accept enum names as well as numbers."""
+            return values_by_name[value].number if isinstance(value, str) else value
+        return convert
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        # Strings are read as base64, as in the JSON mapping
+        return lambda value: base64.b64decode(value) if isinstance(value, str) else value
+    return None
+
+
+def _scalar_getter(field):
+    """Build a function converting a scalar field value for a dictionary."""
+    if field.type == FieldDescriptor.TYPE_ENUM:
+        values_by_number = field.enum_type.values_by_number
+
+        def convert(value):
+            """Render enums by name, as the JSON mapping does."""
+            enum_value = values_by_number.get(value)
+            return enum_value.name if enum_value is not None else value
+        return convert
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        # Bytes are written as base64 strings, as in the JSON mapping
+        return lambda value: base64.b64encode(value).decode('ascii')
+    return None
+
+
+def _build_setter(field):
+    """Build a function assigning a dictionary value to a field of a message."""
+    name = field.name
+
+    if field.message_type is not None and field.message_type.GetOptions().map_entry:
+        value_field = field.message_type.fields_by_name['value']
+        if value_field.message_type is not None:
+            def set_map(message, value):
+                """Fill map entries holding messages."""
+                entries = getattr(message, name)
+                for key, entry in value.items():
+                    fill_message(entries[key], entry)
+        else:
+            convert = _scalar_setter(value_field)
+
+            def set_map(message, value):
+                """Update map entries holding scalars."""
+                getattr(message, name).update(
+                    value if convert is None else {k: convert(v) for k, v in value.items()})
+        return set_map
+
+    if field.message_type is not None:
+        if field.label == FieldDescriptor.LABEL_REPEATED:
+            def set_messages(message, value):
+                """Append a message for every item."""
+                container = getattr(message, name)
+                for item in value:
+                    fill_message(container.add(), item)
+            return set_messages
+
+        json_string = field.message_type.full_name in _JSON_STRING_TYPES
+
+        def set_message(message, value):
+            """Fill a singular message field."""
+            submessage = getattr(message, name)
+            if json_string and isinstance(value, str):
+                submessage.FromJsonString(value)
+            else:
+                fill_message(submessage, value)
+            submessage.SetInParent()
+        return set_message
+
+    convert = _scalar_setter(field)
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        def set_scalars(message, value):
+            """Extend a repeated scalar field."""
+            getattr(message, name).extend(value if convert is None else map(convert, value))
+        return set_scalars
+
+    if convert is None:
+        return lambda message, value: setattr(message, name, value)
+    return lambda message, value: setattr(message, name, convert(value))
+
+
+def _build_getter(field):
+    """Build a function converting a field value of a message to a dictionary value."""
+    if field.message_type is not None and field.message_type.GetOptions().map_entry:
+        value_field = field.message_type.fields_by_name['value']
+        if value_field.message_type is not None:
+            return lambda value: {key: message_to_dict(entry) for key, entry in value.items()}
+        convert = _scalar_getter(value_field)
+        if convert is None:
+            return dict
+        return lambda value: {key: convert(entry) for key, entry in value.items()}
+
+    if field.message_type is not None:
+        if field.message_type.full_name in _JSON_STRING_TYPES:
+            def convert(value):
+                """Render well known types by their JSON string."""
+                return value.ToJsonString()
+        else:
+            convert = message_to_dict
+    else:
+        convert = _scalar_getter(field)
+
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+        return list if convert is None else lambda value: [convert(item) for item in value]
+    return convert
+
+
+def _converters(descriptor):
+    """Return the (setters, getters) for a message type, keyed by field name."""
+    converters = _CONVERTERS.get(descriptor.full_name)
+    if converters is None:
+        converters = _CONVERTERS.setdefault(descriptor.full_name, (
+            {field.name: _build_setter(field) for field in descriptor.fields},
+            {field.name: _build_getter(field) for field in descriptor.fields},
+        ))
+    return converters
+
+
+def fill_message(message, data):
+    """Assign the values of a dictionary to the fields of a message, skipping None values."""
+    setters = _converters(message.DESCRIPTOR)[0]
+    for key, value in data.items():
+        if value is None:
+            continue
+        try:
+            setter = setters[key]
+        except KeyError:
+            raise ParseError(
+                f'Message type "{message.DESCRIPTOR.full_name}" has no field named "{key}".')
+        setter(message, value)
+    return message
+
+
+def message_to_dict(message):
+    """Convert the fields that are set on a message to a dictionary."""
+    getters = _converters(message.DESCRIPTOR)[1]
+    data = {}
+    for field, value in message.ListFields():
+        getter = getters[field.name]
+        data[field.name] = value if getter is None else getter(value)
+    return data
+
+
+class BaseResource(object):
+    """
+    Base class for resource transformers.
+
+    Subclasses implement `_get_message()` and may implement `_dict_to_message(data)` and
+    `_message_to_dict(message)` to adjust values that don't map directly to message fields.
+    """
+
+    @classmethod
+    def dict_to_message(cls, data):
+        """Convert a dictionary to a protocol buffer message."""
+        update_data = getattr(cls, '_dict_to_message', None)
+        if callable(update_data):
+            data = update_data(dict(data))  # pylint: disable=not-callable
+
+        return fill_message(cls._get_message(), data)
+
+    @classmethod
+    def message_to_dict(cls, message):
+        """Convert a protocol buffer message to a dictionary."""
+        data = message_to_dict(message)
+
+        # Some data may need to be manually transformed
+        updated_data = getattr(cls, '_message_to_dict', None)
+        if callable(updated_data):
+            updates = updated_data(message)  # pylint: disable=not-callable
+            nested_keys = [key for key in updates if '.' in key]
+            for key in nested_keys:
+                value = updates.pop(key)
+                reference = data
+                key_pieces = key.split('.')
+                for key_piece in key_pieces[:-1]:
+                    reference = reference.setdefault(key_piece, {})
+                reference[key_pieces[-1]] = value
+            data.update(updates)
+
+        return data
+
+    @classmethod
+    def proto_to_dict(cls, proto):
+        """Convert a serialized protocol buffer string to a dictionary."""
+        message = cls._get_message()
+        message.ParseFromString(proto)
+        return cls.message_to_dict(message)
+
+    @staticmethod
+    def _get_message():
+        """Determines the message to be used during transformation."""
+        raise NotImplementedError
+
+
+class BaseCollection(BaseResource):
+    """
+    Base class for collection transformers.
+
+    The items of a collection are mapped to the repeated message field named by `items_field`
+    (by default the first repeated message field), and `page_size`, `next_page` and `next_cursor`
+    to the fields of the same name when the message has them.
+    """
+
+    items_field = None
+
+    @classmethod
+    def dict_to_message(cls, data):
+        """Convert a dictionary to a protocol buffer message."""
+        message = cls._get_message()
+        update_message = getattr(cls, '_dict_to_message', None)
+        if callable(update_message):
+            update_message(data, message)  # pylint: disable=not-callable
+        else:
+            container = getattr(message, cls._items_field(message))
+            for item in data.get('data') or ():
+                fill_message(container.add(), item)
+
+        fields = message.DESCRIPTOR.fields_by_name
+        for key in ('page_size', 'next_page', 'next_cursor'):
+            if data.get(key) and key in fields:
+                setattr(message, key, data[key])
+        return message
+
+    @classmethod
+    def message_to_dict(cls, message):
+        """Convert a protocol buffer message to a dictionary."""
+        update_data = getattr(cls, '_message_to_dict', None)
+        if callable(update_data):
+            items = update_data(message)  # pylint: disable=not-callable
+        else:
+            items = [message_to_dict(item) for item in getattr(message, cls._items_field(message))]
+
+        data = {'data': items}
+        fields = message.DESCRIPTOR.fields_by_name
+        for key in ('page_size', 'next_page', 'next_cursor'):
+            if key in fields:
+                data[key] = getattr(message, key)
+        return data
+
+    @classmethod
+    def _items_field(cls, message):
+        """Name of the repeated field holding the items of the collection."""
+        if cls.items_field is None:
+            cls.items_field = next(
+                field.name for field in message.DESCRIPTOR.fields
+                if field.label == FieldDescriptor.LABEL_REPEATED and field.message_type is not None
+            )
+        return cls.items_field
@@ -20,12 +20,19 @@ setup(
     zip_safe=False,
     include_package_data=True,
     platforms='any',
+    python_requires='>=3.7',
     install_requires=[
         'Flask',
         'marshmallow==3.1.1'
     ],
     extras_require={
-        'proto': 'protobuf'
+        'proto': 'protobuf',
+        'msgpack': 'msgpack',
+        'brotli': 'brotli',
+        'zstd': 'zstandard',
+        'orjson': 'orjson',
+        'rapidjson': 'python-rapidjson',
+        'ujson': 'ujson'
     },
     classifiers=[
         'Environment :: Web Environment',
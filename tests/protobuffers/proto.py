@@ -4,10 +4,12 @@ Provide transformers for test.
 Named "proto.py" to avoid having pytest perceive this as a test file.
 """
 
-from . import base, proto_pb2
+from luckycharms import protobuf
 
+from . import proto_pb2
 
-class Test(base.BaseResource):
+
+class Test(protobuf.BaseResource):
     """Settings resource protocol buffer transformer."""
 
     @staticmethod
@@ -17,7 +19,7 @@ class Test(base.BaseResource):
         return proto_pb2.Test()
 
 
-class TestCollection(base.BaseCollection):
+class TestCollection(protobuf.BaseCollection):
     """Image collection protocol buffer transformer."""
 
     @staticmethod
@@ -1,16 +1,27 @@
+import asyncio
+import concurrent.futures
 import datetime
+import inspect
+import io
+import itertools
 import json
+import multiprocessing
 import os
+import re
+import threading
+import time
 
 import flask
 import flask_exceptions
 import pytest
-from marshmallow import RAISE, Schema, fields, validates_schema
+from marshmallow import RAISE, Schema, fields, post_load, validates, validates_schema
 
 os.environ['LUCKYCHARMS_SHOW_ERRORS'] = 'true'
 
-from luckycharms.base import (BaseModelSchema,  # isort:skip  # noqa
-                              QuerystringCollection, QuerystringResource)  # isort:skip
+from luckycharms.base import (_QUERYSTRING_SCHEMAS, _WORKER_SCHEMAS,  # isort:skip  # noqa
+                              BaseModelSchema, Keyset, QueryPlan, QuerystringCollection,
+                              QuerystringResource, UnpagedQuerystringCollection,
+                              encode_cursor, _parallel_executor)  # isort:skip
 
 
 try:
@@ -105,6 +116,48 @@ def test_partial_config():
     }
 
 
+def test_config_shared_per_class():
+    """Derived config and querystring schemas are computed once per schema class and options."""
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int(order=('asc',))
+        b = fields.String()
+
+        config = {'querystring_schemas': {'load_many': UnpagedQuerystringCollection}}
+
+    first, second = TestSchema(many=True), TestSchema(many=True)
+    assert first.config is second.config
+    assert first.querystring_schema is second.querystring_schema
+    assert TestSchema.config == {'querystring_schemas': {'load_many': UnpagedQuerystringCollection}}
+    with pytest.raises(TypeError):
+        first.config['paged'] = False
+
+    assert TestSchema().querystring_schema is not first.querystring_schema
+    restricted = TestSchema(many=True, exclude=('b',))
+    assert restricted.querystring_schema is not first.querystring_schema
+    assert restricted.querystring_schema.allowed_fields == {'a'}
+    assert first.querystring_schema.allowed_fields == {'a', 'b'}
+
+
+def test_projections_share_querystring_schema():
+    """Projections reuse their decorator's querystring schema rather than caching their own."""
+
+    names = [f'f{idx}' for idx in range(12)]
+    TestSchema = type('TestSchema', (BaseModelSchema,), {name: fields.Int() for name in names})
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return [dict.fromkeys(names, 1)]
+
+    for projection in itertools.islice(itertools.combinations(names, 3), 200):
+        with app.test_request_context(f'/?fields={",".join(projection)}'):
+            assert list(json.loads(business_logic())['data'][0]) == list(projection)
+    assert len(_QUERYSTRING_SCHEMAS[TestSchema]) == 1
+    schema = business_logic.__self__
+    assert schema._projected_schema(frozenset(names[:2])).querystring_schema is \
+        schema.querystring_schema
+
+
 def test_querystring_schemas():
 
     class TestSchema(BaseModelSchema):
@@ -427,6 +480,63 @@ def test_collections():
         }
 
 
+def test_cursor_paging():
+    """Cursor paging hands the view the keyset of the previous page and emits the next cursor."""
+
+    class TestSchema(BaseModelSchema):
+        id = fields.Int()
+        created = fields.DateTime(order=('desc', 'asc'))
+
+        config = {'paged': 'cursor'}
+
+    start = datetime.datetime(2019, 1, 1)
+    items = [{'id': idx, 'created': start + datetime.timedelta(days=idx // 2)} for idx in range(7)]
+    keysets = []
+
+    @TestSchema(many=True)
+    def business_logic(fields, cursor, page_size, order_by, order):
+        assert (order_by, order) == ('created', 'desc')
+        keysets.append(cursor)
+        ordered = sorted(items, key=lambda item: (item['created'], item['id']), reverse=True)
+        return [
+            item for item in ordered
+            if cursor is None or (item['created'], item['id']) < (cursor.value, cursor.tiebreaker)
+        ]
+
+    ids = []
+    url = '/?page_size=3'
+    while True:
+        with app.test_request_context(url):
+            result = json.loads(business_logic())
+        assert result['page_size'] == 3
+        ids.extend(item['id'] for item in result['data'])
+        if result['next_cursor'] is None:
+            break
+        url = f'/?page_size=3&cursor={result["next_cursor"]}'
+    assert ids == [6, 5, 4, 3, 2, 1, 0]
+    assert keysets == [None, Keyset(items[4]['created'], 4), Keyset(items[1]['created'], 1)]
+
+    with app.test_request_context(f'/?page_size=3&order=asc&cursor={result["next_cursor"]}'):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == 'cursor: Not a valid cursor.'
+
+    for cursor in ('abc', 'bm90IGpzb24', encode_cursor('created', 'desc', 'x', 1)):
+        with app.test_request_context(f'/?cursor={cursor}'):
+            with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+                business_logic()
+            assert excinfo.value.message == 'cursor: Not a valid cursor.'
+
+    with app.test_request_context('/?page=2'):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == '_schema: page is an invalid querystring argument.'
+
+    with pytest.raises(Exception) as excinfo:
+        type('TestSchema', (BaseModelSchema,), {'a': fields.Int(), 'config': {'paged': 'cursor'}})()
+    assert str(excinfo.value) == 'Tiebreaker field "id" is not declared.'
+
+
 def test_paging_validation():
     class TestSchema(BaseModelSchema):
         a = fields.Int(order=('desc',))
@@ -721,6 +831,14 @@ def test_unpaged_collection():
     assert "page_size" not in result
     assert "next_page" not in result
 
+    # Without configured querystring schemas, unpaged views still accept page parameters
+    @UnpagedTestSchema(many=True)
+    def business_logic(page, page_size, **kwargs):  # noqa: F811
+        return [{"a": page}] * page_size
+
+    with app.test_request_context("/?page=2&page_size=3"):
+        assert json.loads(business_logic()) == {"data": [{"a": 2}] * 3}
+
 
 def test_proto_with_empty_request_body(*args, **kwargs):
 
@@ -777,3 +895,920 @@ def test_many_body(*args, **kwargs):
 
     with app.test_request_context("/", method="PUT", headers={"Accept": "application/json"}):
         business_logic()  # Not raising an exception is the test
+
+
+def test_streamed_request_bodies():
+    """NDJSON bodies are validated a chunk at a time as the view iterates over them."""
+
+    loaded = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+
+        @post_load
+        def count_loads(self, data, **kwargs):
+            loaded.append(data['a'])
+            return data
+
+    received = []
+    validated = []
+
+    @TestSchema(many=True)
+    def business_logic(data):
+        for item in data:
+            received.append(item)
+            validated.append(len(loaded))
+
+    body = b'\n'.join(json.dumps({'a': idx, 'b': str(idx)}).encode() for idx in range(250))
+    with app.test_request_context('/', method='POST', data=body + b'\n\n',
+                                  headers={'Content-Type': 'application/x-ndjson'}):
+        business_logic()
+    assert received == [{'a': idx, 'b': str(idx)} for idx in range(250)]
+    # Only the chunk holding the current item has been validated
+    assert validated == [100] * 100 + [200] * 100 + [250] * 50
+
+    body = body.replace(b'"a": 150', b'"a": "x"')
+    loaded.clear()
+    with app.test_request_context('/', method='POST', data=body,
+                                  headers={'Content-Type': 'application/x-ndjson'}):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == "150: {'a': ['Not a valid integer.']}"
+
+    with app.test_request_context('/', method='POST', data=b'{"a": 1}\n{"a"',
+                                  headers={'Content-Type': 'application/x-ndjson'}):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == 'Invalid json data'
+
+    with app.test_request_context('/', method='POST', data=json.dumps([{'a': 1}]),
+                                  headers={'Content-Type': 'application/json'}):
+        business_logic()
+    assert received[-1] == {'a': 1}
+
+
+def test_streamed_protobuf_bodies():
+    """Length-delimited protocol buffer bodies are decoded message by message."""
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+        c = fields.Boolean()
+
+        config = {'protobuffers': {'load': proto.Test()}}
+
+    @TestSchema(many=True)
+    def business_logic(data):
+        return list(data)
+
+    def delimited(message):
+        body = message.SerializeToString()
+        size, prefix = len(body), b''
+        while size > 0x7f:
+            prefix += bytes([size & 0x7f | 0x80])
+            size >>= 7
+        return prefix + bytes([size]) + body
+
+    items = [{'a': idx, 'b': 'x' * idx, 'c': True} for idx in range(1, 200, 7)]
+    body = b''.join(delimited(proto.Test.dict_to_message(item)) for item in items)
+    headers = {'Content-Type': 'application/x-protobuf-delimited'}
+    with app.test_request_context('/', method='POST', data=body, headers=headers):
+        assert json.loads(business_logic())['data'] == items
+
+    with app.test_request_context('/', method='POST', data=body[:-3], headers=headers):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == 'Invalid protocol buffer data'
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_error_budget(compiled):
+    """Validation stops once max_errors errors are found."""
+
+    validated = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String(order=('asc',))
+
+        config = {'max_errors': 2, 'compiled_load': compiled}
+
+        @validates('b')
+        def validate_b(self, value):
+            validated.append(value)
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        pass  # pragma: no cover
+
+    body = json.dumps([{'a': 'x', 'b': 'b'}] * 1000)
+    with app.test_request_context('/', method='POST', data=body,
+                                  headers={'Content-Type': 'application/json'}):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+    assert excinfo.value.message == \
+        "0: {'a': ['Not a valid integer.']};1: {'a': ['Not a valid integer.']}"
+    assert validated == []
+
+    class FailFastSchema(TestSchema):
+        config = {'max_errors': 1}
+
+    @FailFastSchema(many=True)
+    def business_logic(**kwargs):
+        pass  # pragma: no cover
+
+    with app.test_request_context('/?page_size=abc&fields=c&order_by=c'):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+    assert excinfo.value.message == 'page_size: Not a valid integer.'
+
+
+def test_request_size_limits():
+    """Bodies over max_content_length and collections over max_items are rejected up front."""
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+
+        config = {'max_content_length': 100, 'max_items': 3}
+
+    @TestSchema(many=True)
+    def business_logic(data):
+        return list(data)
+
+    cases = [
+        ('application/json', json.dumps([{'a': 1}] * 20), 'Request body too large.'),
+        ('application/json', json.dumps([{'a': 1}] * 4), 'Too many items.'),
+        ('application/x-ndjson', '{"a": 1}\n' * 20, 'Request body too large.'),
+        ('application/x-ndjson', '{"a": 1}\n' * 4, 'Too many items.'),
+    ]
+    for content_type, body, message in cases:
+        for chunked in (False, True):
+            with app.test_request_context('/', method='POST', data=body,
+                                          headers={'Content-Type': content_type}):
+                if chunked:
+                    environ = flask.request.environ
+                    del environ['CONTENT_LENGTH']
+                    environ['wsgi.input_terminated'] = True
+                    environ['wsgi.input'] = io.BytesIO(body.encode())
+                with pytest.raises(flask_exceptions.APIException) as excinfo:
+                    business_logic()
+            assert (excinfo.value.status_code, excinfo.value.message) == (413, message)
+
+    with app.test_request_context('/', method='POST', data=json.dumps([{'a': 1}] * 3),
+                                  headers={'Content-Type': 'application/json'}):
+        assert len(json.loads(business_logic())['data']) == 3
+
+
+def test_field_projection():
+    """Unrequested fields are never serialized and projected schemas are cached."""
+
+    calls = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b_ = fields.String(data_key='b', attribute='b')
+        c = fields.Method('get_c')
+
+        def get_c(self, obj):
+            calls.append(obj['a'])
+            return obj['a'] * 2
+
+    @TestSchema(many=True)
+    def business_logic(*args, **kwargs):
+        return [{'a': 1, 'b': 'One'}, {'a': 2, 'b': 'Two'}]
+
+    with app.test_request_context('/?fields=a,b'):
+        result = json.loads(business_logic())
+    assert result['data'] == [{'a': 1, 'b': 'One'}, {'a': 2, 'b': 'Two'}]
+    assert calls == []
+
+    with app.test_request_context('/?fields=c'):
+        result = json.loads(business_logic())
+    assert result['data'] == [{'c': 2}, {'c': 4}]
+    assert calls == [1, 2]
+
+    with app.test_request_context('/?fields=b,a'):
+        business_logic()
+    schema = business_logic.__self__
+    assert schema._projected_schema.cache_info().hits == 1
+    assert schema._projected_schema.cache_info().currsize == 2
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_projected_key_order(compiled):
+    """Serialized keys follow declaration order whatever the hash seed and requested order."""
+
+    names = ['alpha', 'beta', 'gamma', 'delta', 'eps', 'zeta', 'eta', 'theta', 'iota', 'kappa']
+    TestSchema = type('TestSchema', (BaseModelSchema,), {
+        **{name: fields.Int() for name in names},
+        'config': {'compiled_dump': compiled},
+    })
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return [dict.fromkeys(names, 1)]
+
+    requested = names[::-2]
+    for querystring in [f'fields={",".join(requested)}', '']:
+        with app.test_request_context(f'/?{querystring}'):
+            body = business_logic()
+        expected = [name for name in names if name in requested] if querystring else names
+        assert body.index(f'"{expected[0]}"') < body.index(f'"{expected[-1]}"')
+        assert list(json.loads(body)['data'][0]) == expected
+
+
+def test_query_plan():
+    """Views opting in to query plans are told which attributes, order and page to fetch."""
+
+    class ChildSchema(Schema):
+        name = fields.String()
+
+    class TestSchema(BaseModelSchema):
+        id = fields.Int()
+        title = fields.String(data_key='name', attribute='heading', order=('asc', 'desc'))
+        body = fields.String()
+        summary = fields.Method('get_summary', requires=('heading', 'body'))
+        parent = fields.Nested(ChildSchema)
+        secret = fields.String(load_only=True)
+
+        config = {'query_plan': True}
+
+        def get_summary(self, obj):
+            return f'{obj["heading"]}: {obj["body"][:5]}'
+
+    plans = []
+    model = {'id': 1, 'heading': 'Title', 'body': 'Long text', 'parent': {'name': 'Parent'}}
+
+    @TestSchema(many=True)
+    def business_logic(plan):
+        plans.append(plan)
+        return [model]
+
+    with app.test_request_context('/?page=3&page_size=10&order=desc&fields=name,summary'):
+        result = json.loads(business_logic())
+    assert result['data'] == [{'name': 'Title', 'summary': 'Title: Long '}]
+    assert plans[-1] == QueryPlan(
+        attributes=('heading', 'body'), fields=('name', 'summary'), order_by='heading',
+        order='desc', page=3, page_size=10, cursor=None, offset=20, limit=11)
+
+    with app.test_request_context('/?page=*&fields=id'):
+        business_logic()
+    assert plans[-1].attributes == ('id',)
+    assert (plans[-1].offset, plans[-1].limit) == (None, None)
+
+    @TestSchema()
+    def business_logic(plan):
+        plans.append(plan)
+        return {'id': 1, 'heading': 'Title'}
+
+    with app.test_request_context('/?fields=id,name'):
+        assert json.loads(business_logic()) == {'id': 1, 'name': 'Title'}
+    assert plans[-1] == QueryPlan(('id', 'heading'), ('id', 'name'), *[None] * 7)
+
+    with app.test_request_context('/'):
+        with pytest.raises(Exception) as excinfo:
+            business_logic()
+        assert str(excinfo.value) == 'Attributes missing from the view result: body, parent.'
+
+    class CursorSchema(BaseModelSchema):
+        id = fields.Int(attribute='pk')
+        a = fields.Int()
+
+        config = {'paged': 'cursor', 'query_plan': True}
+
+    @CursorSchema(many=True)
+    def business_logic(plan):
+        plans.append(plan)
+        return [{'pk': 1, 'a': 1}, {'pk': 2, 'a': 2}]
+
+    with app.test_request_context('/?fields=a&page_size=1'):
+        assert json.loads(business_logic())['next_cursor']
+    assert plans[-1].attributes == ('a', 'pk')
+    assert (plans[-1].order_by, plans[-1].limit) == ('pk', 2)
+
+    with pytest.raises(Exception) as excinfo:
+        type('TestSchema', (BaseModelSchema,), {
+            'a': fields.Function(lambda obj: obj.a), 'config': {'query_plan': True}})()
+    assert str(excinfo.value) == 'Field "a" must declare the attributes it requires.'
+
+
+def test_batched_loaders():
+    """Loader fields are resolved with one call per loader for a whole collection."""
+
+    calls = []
+    authors = {1: {'name': 'Ann'}, 2: {'name': 'Bob'}}
+
+    def load_authors(keys):
+        calls.append(('authors', keys, threading.current_thread().name))
+        return {key: authors[key] for key in keys}
+
+    def load_comments(keys):
+        calls.append(('comments', keys, threading.current_thread().name))
+        assert flask.request.path == '/'
+        return {key: [{'text': f'comment on {key}'}] for key in keys if key % 2}
+
+    class AuthorSchema(Schema):
+        name = fields.String()
+
+    class TestSchema(BaseModelSchema):
+        id = fields.Int()
+        author = fields.Nested(AuthorSchema, loader=load_authors, loader_key='author_id')
+        comments = fields.List(fields.Dict(), loader=load_comments)
+        byline = fields.Method('get_byline', loader=load_authors, loader_key='author_id',
+                               requires=('id',))
+
+        config = {'query_plan': True}
+
+        def get_byline(self, obj, author):
+            return f'{obj["id"]} by {author["name"]}' if author else None
+
+    models = [{'id': idx, 'author_id': idx % 2 + 1 if idx < 5 else None} for idx in range(6)]
+
+    @TestSchema(many=True)
+    def business_logic(plan):
+        assert plan.attributes[:2] == ('id', 'author_id')
+        return models
+
+    with app.test_request_context('/'):
+        result = json.loads(business_logic())['data']
+    assert result[:2] == [
+        {'id': 0, 'author': {'name': 'Ann'}, 'comments': None, 'byline': '0 by Ann'},
+        {'id': 1, 'author': {'name': 'Bob'}, 'comments': [{'text': 'comment on 1'}],
+         'byline': '1 by Bob'},
+    ]
+    assert result[5] == {
+        'id': 5, 'author': None, 'comments': [{'text': 'comment on 5'}], 'byline': None}
+    assert sorted(call[:2] for call in calls) == [
+        ('authors', [1, 2]), ('authors', [1, 2]), ('comments', list(range(6)))]
+
+    # Unrequested fields are not loaded
+    calls.clear()
+    with app.test_request_context('/?fields=id,author'):
+        business_logic()
+    assert [call[0] for call in calls] == ['authors']
+
+    # Loaders run concurrently in the executor, with the request context
+    class PooledSchema(TestSchema):
+        config = {'loader_executor': concurrent.futures.ThreadPoolExecutor(2)}
+
+    @PooledSchema()
+    def business_logic(**kwargs):
+        return models[1]
+
+    calls.clear()
+    with app.test_request_context('/'):
+        assert json.loads(business_logic()) == {
+            'id': 1, 'author': {'name': 'Bob'}, 'comments': [{'text': 'comment on 1'}],
+            'byline': '1 by Bob'}
+    assert len(calls) == 3
+    assert threading.current_thread().name not in {call[2] for call in calls}
+
+    class FunctionSchema(BaseModelSchema):
+        author = fields.Function(lambda obj: obj, loader=load_authors)
+
+    with pytest.raises(Exception) as excinfo:
+        FunctionSchema()
+    assert str(excinfo.value) == 'Function field "author" can\'t have a loader.'
+
+
+def test_concurrent_requests_are_isolated():
+    """One decorated view serves concurrent requests without leaking state between them."""
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+        c = fields.Boolean()
+
+    @TestSchema(many=True)
+    def business_logic(page, page_size, **kwargs):
+        time.sleep(0)
+        return [{'a': idx, 'b': str(idx), 'c': bool(idx % 2)} for idx in range(page_size + 1)]
+
+    requests = [
+        ('/?fields=a&page_size=1', {'data': [{'a': 0}], 'page_size': 1, 'next_page': True}),
+        ('/?fields=b,c&page_size=2', {
+            'data': [{'b': '0', 'c': False}, {'b': '1', 'c': True}],
+            'page_size': 2,
+            'next_page': True
+        }),
+        ('/?page_size=1', {'data': [{'a': 0, 'b': '0', 'c': False}], 'page_size': 1,
+                           'next_page': True}),
+    ]
+    barrier = threading.Barrier(len(requests) * 3)
+    failures = []
+
+    def worker(path, expected):
+        barrier.wait()
+        for _ in range(200):
+            with app.test_request_context(path):
+                result = json.loads(business_logic())
+            if result != expected:
+                failures.append((path, result))
+
+    threads = [
+        threading.Thread(target=worker, args=request)
+        for request in requests * 3
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+
+
+def test_request_state_is_owned():
+    """Schemas other than the decorator and its projections keep their own context."""
+
+    class InnerSchema(BaseModelSchema):
+        a = fields.Method('get_a')
+
+        def get_a(self, obj):
+            return f'{self.context.get("prefix", "MISSING")}{obj["a"]}'
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        inner = fields.Raw()
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        inner = InnerSchema(context={'prefix': 'p-'}).dump({'a': 1})
+        inner_many = InnerSchema(many=True).dump([{'a': 1}, {'a': 2}])
+        return [{'a': 1, 'inner': json.loads(inner)}, {'a': 2, 'inner': json.loads(inner_many)}]
+
+    with app.test_request_context('/?page_size=5&fields=inner'):
+        result = json.loads(business_logic())
+    assert result == {
+        'data': [
+            {'inner': {'a': 'p-1'}},
+            {'inner': {'data': [{'a': 'MISSING1'}, {'a': 'MISSING2'}]}},
+        ],
+        'page_size': 5,
+        'next_page': False,
+    }
+
+
+def test_querystring_plan():
+    """Querystring plans are compiled once per querystring schema class."""
+
+    class TestQuerystringSchema(QuerystringResource):
+        a = fields.List(fields.String())
+
+    class TestSchema(BaseModelSchema):
+        a = fields.List(fields.String())
+        b = fields.Int()
+
+        config = {
+            'querystring_schemas': {
+                'load': TestQuerystringSchema
+            }
+        }
+
+    @TestSchema()
+    def business_logic(*args, **kwargs):
+        return {'a': kwargs['a'], 'b': 1}
+
+    @TestSchema()
+    def other_business_logic(*args, **kwargs):
+        return {'a': kwargs['a'], 'b': 2}
+
+    with app.test_request_context('/?a[]=1&a[]=2&fields=a'):
+        assert json.loads(business_logic()) == {'a': ['1', '2']}
+    with app.test_request_context('/?a[]=3&fields=b'):
+        assert json.loads(other_business_logic()) == {'b': 2}
+
+    plan = business_logic.__self__.querystring_schema.querystring_plan
+    assert plan is other_business_logic.__self__.querystring_schema.querystring_plan
+    assert plan.field_names == {'a', 'fields'}
+    assert plan.list_keys == {'a[]': 'a', 'fields[]': 'fields'}
+
+    # Querystrings may still be loaded as an (items, lists) pair
+    with app.test_request_context('/?a[]=1&a[]=2&fields=a'):
+        args = flask.request.args
+        assert business_logic.__self__.querystring_schema.load((args.items(), args.lists())) == \
+            business_logic.__self__.querystring_schema.load(args) == \
+            {'a': ['1', '2'], 'fields': 'a'}
+
+    with app.test_request_context('/?c[]=1'):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == '_schema: c is an invalid querystring argument.'
+
+
+def test_page_sliced_before_dump():
+    """Only the requested page is taken from the view's result and serialized."""
+
+    dumped = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Method('get_a')
+
+        def get_a(self, obj):
+            dumped.append(obj)
+            return obj
+
+    @TestSchema(many=True)
+    def business_logic(*args, **kwargs):
+        return itertools.count()
+
+    with app.test_request_context('/?page_size=3'):
+        result = json.loads(business_logic())
+    assert result == {
+        'data': [{'a': 0}, {'a': 1}, {'a': 2}],
+        'page_size': 3,
+        'next_page': True
+    }
+    assert dumped == [0, 1, 2]
+
+    @TestSchema(many=True)
+    def business_logic(*args, **kwargs):
+        return iter(range(3))
+
+    with app.test_request_context('/?page_size=3'):
+        result = json.loads(business_logic())
+    assert result['next_page'] is False
+    assert len(result['data']) == 3
+
+
+def test_streaming_collections():
+    """Streamed collections produce the same JSON as buffered ones, one chunk at a time."""
+
+    produced = []
+
+    def generate(count):
+        for idx in range(count):
+            produced.append(idx)
+            yield {'a': idx, 'b': str(idx)}
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+
+    class StreamingTestSchema(TestSchema):
+        config = {'streaming': True}
+
+    @TestSchema(many=True)
+    def buffered_logic(page_size, **kwargs):
+        return generate(page_size + 1)
+
+    @StreamingTestSchema(many=True)
+    def business_logic(page_size, **kwargs):
+        return generate(page_size + 1)
+
+    with app.test_request_context('/?page_size=2&fields=a'):
+        expected = buffered_logic()
+        response = business_logic()
+        assert isinstance(response, flask.Response)
+        assert response.mimetype == 'application/json'
+        assert response.get_data(as_text=True) == expected
+    assert json.loads(expected) == {'data': [{'a': 0}, {'a': 1}], 'page_size': 2,
+                                    'next_page': True}
+
+    class UnconditionalPagingQuerystringCollection(QuerystringCollection):
+        config = {'unconditional_paging': True}
+
+    class ExportTestSchema(TestSchema):
+        config = {
+            'streaming': True,
+            'querystring_schemas': {
+                'load_many': UnconditionalPagingQuerystringCollection,
+            }
+        }
+
+    @ExportTestSchema(many=True)
+    def business_logic(**kwargs):
+        return generate(250)
+
+    produced.clear()
+    with app.test_request_context('/?page=*'):
+        chunks = business_logic().response
+        body = next(chunks)
+        assert body == b'{"data": ['
+        body += next(chunks)
+        # Only the first chunk of items has been taken from the view's result
+        assert len(produced) == 100
+        body += b''.join(chunks)
+    assert json.loads(body) == {
+        'data': [{'a': idx, 'b': str(idx)} for idx in range(250)],
+        'page_size': 25,
+        'next_page': False
+    }
+
+    class UnpagedTestSchema(TestSchema):
+        config = {'paged': False, 'streaming': True}
+
+    @UnpagedTestSchema(many=True)
+    def business_logic(**kwargs):
+        return []
+
+    with app.test_request_context('/'):
+        assert business_logic().get_data(as_text=True) == '{"data": []}'
+
+
+class ParallelTestSchema(BaseModelSchema):
+    """Dumped in worker processes, so defined where they can import it."""
+
+    a = fields.Int()
+    b = fields.String()
+    pid = fields.Function(lambda obj: os.getpid())
+
+    config = {'paged': False, 'parallel_dump': {'threshold': 100, 'chunk_size': 30}}
+
+
+def test_parallel_dump(monkeypatch):
+    """Large collections are dumped a chunk at a time in the executor, into the same JSON."""
+
+    @ParallelTestSchema(many=True)
+    def business_logic(**kwargs):
+        return [{'a': idx, 'b': str(idx)} for idx in range(size)]
+
+    with concurrent.futures.ProcessPoolExecutor(
+            2, mp_context=multiprocessing.get_context('fork')) as processes:
+        monkeypatch.setattr('luckycharms.base._parallel_executor', lambda: processes)
+        for size, parallel in [(250, True), (99, False)]:
+            with app.test_request_context('/?fields=a,pid'):
+                result = json.loads(business_logic())
+            assert [item['a'] for item in result['data']] == list(range(size))
+            assert 'b' not in result['data'][0]
+            pids = {item['pid'] for item in result['data']}
+            assert (os.getpid() not in pids) is parallel
+
+    threads = concurrent.futures.ThreadPoolExecutor(2)
+
+    class ThreadedTestSchema(BaseModelSchema):
+        a = fields.Int(order=('asc',))
+        # Worker threads run in the request context
+        q = fields.Function(lambda obj: flask.request.headers.get('X-Q'))
+
+        config = {'parallel_dump': {'threshold': 10, 'chunk_size': 4, 'executor': threads}}
+
+    class SerialTestSchema(ThreadedTestSchema):
+        config = {}
+
+    class UnconditionalPagingQuerystringCollection(QuerystringCollection):
+        config = {'unconditional_paging': True}
+
+    class ExportTestSchema(ThreadedTestSchema):
+        config = {
+            **ThreadedTestSchema.config,
+            'querystring_schemas': {'load_many': UnconditionalPagingQuerystringCollection},
+        }
+
+    results = {}
+    with threads:
+        for schema_class, path in [
+                (SerialTestSchema, '/?page_size=20'),
+                (ThreadedTestSchema, '/?page_size=20'),
+                (ExportTestSchema, '/?page=*&fields=a')]:
+            view = schema_class(many=True)(lambda **kwargs: [{'a': idx} for idx in range(50)])
+            with app.test_request_context(path, headers={'X-Q': 'x'}):
+                body = view()
+            # Parallel dumps return the same type as the codec does
+            assert isinstance(body, str)
+            results[schema_class, path] = json.loads(body)
+
+        # Workers keep a bounded number of projected schemas
+        monkeypatch.setattr('luckycharms.base.PROJECTION_CACHE_SIZE', 2)
+        for projection in ('a', 'q', 'a,q'):
+            with app.test_request_context(f'/?page_size=20&fields={projection}'):
+                assert len(json.loads(view())['data']) == 20
+        assert len(_WORKER_SCHEMAS) == 2
+
+    assert results[ThreadedTestSchema, '/?page_size=20'] == \
+        results[SerialTestSchema, '/?page_size=20'] == \
+        {'data': [{'a': idx, 'q': 'x'} for idx in range(20)], 'page_size': 20, 'next_page': True}
+    assert results[ExportTestSchema, '/?page=*&fields=a'] == {
+        'data': [{'a': idx} for idx in range(50)], 'page_size': 25, 'next_page': False}
+
+
+def test_default_parallel_executor():
+    """Worker processes are not forked from the (possibly threaded) server process."""
+
+    executor = _parallel_executor()
+    try:
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            assert executor._mp_context.get_start_method() in ('forkserver', 'spawn')
+    finally:
+        executor.shutdown()
+        _parallel_executor.cache_clear()
+
+
+def test_conditional_requests():
+    """Clients holding a current copy of a response get a 304 before it is serialized."""
+
+    dumped = []
+
+    class TestModel:
+
+        def __init__(self, a, updated_dt):
+            self.a = a
+            self.updated_dt = updated_dt
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Method('get_a')
+
+        config = {'conditional': True}
+
+        def get_a(self, obj):
+            dumped.append(obj.a)
+            return obj.a
+
+    first = datetime.datetime(2019, 1, 1, 12, 0, 0, 500)
+    second = datetime.datetime(2019, 1, 2, 12, 0, 0)
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return [TestModel(1, first), TestModel(2, second)]
+
+    with app.test_request_context('/'):
+        result = business_logic()
+        response = app.process_response(app.make_response(result))
+        assert flask.g.last_modified == second
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified'] == 'Wed, 02 Jan 2019 12:00:00 GMT'
+    assert dumped == [1, 2]
+
+    with app.test_request_context('/', headers={'If-None-Match': etag}):
+        response = business_logic()
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+    with app.test_request_context('/', headers={'If-None-Match': '"other"'}):
+        assert business_logic() == result
+    with app.test_request_context(
+            '/', headers={'If-Modified-Since': 'Wed, 02 Jan 2019 12:00:00 GMT'}):
+        assert business_logic().status_code == 304
+    with app.test_request_context(
+            '/', headers={'If-Modified-Since': 'Wed, 02 Jan 2019 11:59:59 GMT'}):
+        assert business_logic() == result
+    assert dumped == [1, 2] * 4
+
+    class VersionedTestSchema(TestSchema):
+
+        config = {
+            'conditional': True,
+            'etag': lambda data: data.a * 10
+        }
+
+    @VersionedTestSchema()
+    def business_logic(**kwargs):
+        return TestModel(1, first)
+
+    dumped.clear()
+    with app.test_request_context('/', headers={'If-None-Match': '"10"'}):
+        response = business_logic()
+        assert response.status_code == 304
+        assert response.headers['Last-Modified'] == 'Tue, 01 Jan 2019 12:00:00 GMT'
+    assert dumped == []
+
+
+def test_coroutine_views():
+    """Coroutine functions are awaited and their results run through the same pipeline."""
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+
+    async def fetch(idx):
+        await asyncio.sleep(0)
+        return {'a': idx, 'b': str(idx)}
+
+    @TestSchema()
+    async def business_logic(**kwargs):
+        return await fetch(1)
+
+    @TestSchema(many=True)
+    async def business_logic_many(page_size, **kwargs):
+        return await asyncio.gather(*(fetch(idx) for idx in range(page_size + 1)))
+
+    assert inspect.iscoroutinefunction(business_logic)
+
+    with app.test_request_context('/?fields=b'):
+        assert json.loads(asyncio.run(business_logic())) == {'b': '1'}
+
+    with app.test_request_context('/?page_size=2&fields=a'):
+        assert json.loads(asyncio.run(business_logic_many())) == {
+            'data': [{'a': 0}, {'a': 1}],
+            'page_size': 2,
+            'next_page': True
+        }
+
+    with app.test_request_context(
+            '/',
+            method='POST',
+            data=json.dumps({'a': 'one'}),
+            headers={'Content-Type': 'application/json'}
+            ):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            asyncio.run(business_logic())
+        assert excinfo.value.message == 'a: Not a valid integer.'
+
+
+def test_coroutine_views_offload_dump():
+    """Large collection dumps of coroutine views run in an executor with the request state."""
+
+    threads = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Method('get_a')
+
+        config = {'offload_dump': 2, 'paged': False}
+
+        def get_a(self, obj):
+            threads.append(threading.get_ident())
+            assert flask.request.path == '/items'
+            return obj
+
+    @TestSchema(many=True)
+    async def business_logic(**kwargs):
+        return [1, 2]
+
+    with app.test_request_context('/items?fields=a'):
+        assert json.loads(asyncio.run(business_logic())) == {'data': [{'a': 1}, {'a': 2}]}
+    assert threads[0] != threading.get_ident()
+
+    threads.clear()
+
+    @TestSchema(many=True)
+    async def business_logic(**kwargs):
+        return [1]
+
+    with app.test_request_context('/items'):
+        asyncio.run(business_logic())
+    assert threads == [threading.get_ident()]
+
+
+def test_phase_timings():
+    """Phase timings are handed to the metrics sink and exposed as a Server-Timing header."""
+
+    reports = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+
+        config = {
+            'metrics': lambda view, timings: reports.append((view, timings)),
+            'server_timing': True
+        }
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return [{'a': 1, 'b': 'One'}, {'a': 2, 'b': 'Two'}, {'a': 3, 'b': 'Three'}]
+
+    with app.test_request_context('/?page_size=2'):
+        result = business_logic()
+        response = app.process_response(app.make_response(result))
+
+    view, timings = reports.pop()
+    assert view == 'test_base.test_phase_timings.<locals>.business_logic'
+    assert [timing.phase for timing in timings] == ['querystring', 'view', 'dump', 'encode']
+    assert all(timing.duration >= 0 for timing in timings)
+    assert timings[1].items == 2
+    assert timings[2].items == 2
+    assert timings[3].size == len(result)
+    assert re.fullmatch(
+        r'querystring;dur=[\d.]+, view;dur=[\d.]+, dump;dur=[\d.]+, encode;dur=[\d.]+',
+        response.headers['Server-Timing'])
+
+    @TestSchema()
+    def business_logic(**kwargs):
+        return kwargs
+
+    body = json.dumps({'a': 1})
+    with app.test_request_context(
+            '/', method='POST', data=body, headers={'Content-Type': 'application/json'}):
+        business_logic()
+    _, timings = reports.pop()
+    assert timings[0] == ('load', timings[0].duration, 1, len(body))
+
+    class StreamedTestSchema(TestSchema):
+        config = {**TestSchema.config, 'paged': False, 'streaming': True}
+
+    @StreamedTestSchema(many=True)
+    def business_logic(**kwargs):
+        return ({'a': idx, 'b': str(idx)} for idx in range(250))
+
+    with app.test_request_context('/'):
+        response = app.process_response(business_logic())
+        # The header is sent before the body is generated, so it can't time dump and encode
+        assert re.fullmatch(r'querystring;dur=[\d.]+, view;dur=[\d.]+',
+                            response.headers['Server-Timing'])
+        assert reports == []
+        body = b''.join(response.response)
+
+    _, timings = reports.pop()
+    assert [timing.phase for timing in timings] == ['querystring', 'view', 'dump', 'encode']
+    assert timings[2].items == 250
+    assert timings[3].size == len(body)
+
+    class UntimedTestSchema(BaseModelSchema):
+        a = fields.Int()
+
+    @UntimedTestSchema()
+    def business_logic(**kwargs):
+        return {'a': 1}
+
+    with app.test_request_context('/'):
+        response = app.process_response(app.make_response(business_logic()))
+    assert 'Server-Timing' not in response.headers
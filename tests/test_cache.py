@@ -0,0 +1,309 @@
+"""Test the response cache."""
+# pylint: disable=invalid-name
+import datetime
+import json
+import pickle
+
+import flask
+import pytest
+from marshmallow import fields, post_dump
+
+from conftest import app
+from luckycharms import cache
+from luckycharms.base import BaseModelSchema
+from protobuffers import proto
+
+
+class SharedCache(cache.BaseCache):
+    """Stand-in for a cache shared between processes, which only stores bytes."""
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        value = self.store.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.store[key] = pickle.dumps(value)
+
+    def invalidate(self, namespace):
+        for key in [key for key in self.store if key.startswith(namespace + ':')]:
+            del self.store[key]
+
+
+@pytest.fixture(params=[cache.MemoryCache, SharedCache])
+def backend(request):
+    return request.param()
+
+
+def test_response_cache(backend):
+
+    calls = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int(order=('asc',))
+        b = fields.String()
+
+        config = {
+            'cache': {
+                'backend': backend,
+                'ttl': 60
+            },
+            'protobuffers': {
+                'dump_many': proto.TestCollection()
+            }
+        }
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        calls.append(kwargs)
+        return [{'a': 1, 'b': 'One'}, {'a': 2, 'b': 'Two'}]
+
+    with app.test_request_context('/?fields=a,b'):
+        expected = business_logic()
+    with app.test_request_context('/?fields=b,a'):
+        assert business_logic() == expected
+    with app.test_request_context('/?fields=b,a', headers={'Accept': 'application/json'}):
+        assert business_logic() == expected
+    assert len(calls) == 1
+
+    with app.test_request_context('/?fields=a'):
+        assert json.loads(business_logic())['data'] == [{'a': 1}, {'a': 2}]
+    with app.test_request_context('/?fields=a&page_size=1'):
+        assert json.loads(business_logic())['data'] == [{'a': 1}]
+    with app.test_request_context('/?fields=a', headers={'Accept': 'application/octet-stream'}):
+        assert isinstance(business_logic(), bytes)
+    assert len(calls) == 4
+
+    business_logic.__self__.invalidate_cache()
+    with app.test_request_context('/?fields=a'):
+        business_logic()
+    assert len(calls) == 5
+
+    # Responses are not shared with other views using the same schema
+    @TestSchema(many=True)
+    def other_business_logic(**kwargs):
+        calls.append(kwargs)
+        return []
+
+    with app.test_request_context('/?fields=a'):
+        assert other_business_logic() == ''
+    assert len(calls) == 6
+
+
+def test_planned_response_cache():
+
+    calls = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+
+        config = {'cache': {'backend': cache.MemoryCache()}, 'query_plan': True}
+
+    @TestSchema(many=True)
+    def business_logic(plan, **kwargs):
+        calls.append(plan)
+        return [{'a': 1, 'b': 'One'}]
+
+    # Views taking a query plan share entries between orderings of the same fields
+    with app.test_request_context('/?fields=a,b'):
+        expected = business_logic()
+    with app.test_request_context('/?fields=b,a'):
+        assert business_logic() == expected
+    with app.test_request_context('/?fields=a'):
+        business_logic()
+    assert [plan.fields for plan in calls] == [('a', 'b'), ('a',)]
+
+
+def test_cache_hits_set_last_modified(backend):
+
+    class TestModel:
+
+        def __init__(self, a, updated_dt):
+            self.a = a
+            self.updated_dt = updated_dt
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+
+        config = {'cache': {'backend': backend}}
+
+    calls = []
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        calls.append(kwargs)
+        return [TestModel(1, datetime.datetime(2019, 1, 2)), TestModel(2, None)]
+
+    for _ in range(2):
+        with app.test_request_context('/'):
+            response = app.process_response(app.make_response(business_logic()))
+            assert flask.g.last_modified == datetime.datetime(2019, 1, 2)
+        # Only conditional responses carry the validator
+        assert response.last_modified is None
+    assert len(calls) == 1
+
+
+def test_memory_cache_bounds(monkeypatch):
+
+    now = [100.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+
+    memory_cache = cache.MemoryCache(maxsize=2)
+    memory_cache.set('a:1', 1, ttl=10)
+    memory_cache.set('a:2', 2, ttl=20)
+    assert memory_cache.get('a:1') == 1
+    memory_cache.set('b:3', 3, ttl=10)
+    # a:2 was the least recently used
+    assert memory_cache.get('a:2') is None
+    assert len(memory_cache) == 2
+
+    now[0] = 110.0
+    assert memory_cache.get('a:1') is None
+    assert memory_cache.get('b:3') is None
+    assert len(memory_cache) == 0
+
+    memory_cache.set('a:1', 1, ttl=10)
+    memory_cache.set('b:1', 1, ttl=10)
+    memory_cache.invalidate('a')
+    assert memory_cache.get('a:1') is None
+    assert memory_cache.get('b:1') == 1
+
+
+def test_cache_requires_backend():
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+
+        config = {'cache': {'ttl': 60}}
+
+    with pytest.raises(Exception) as excinfo:
+        TestSchema()
+    assert str(excinfo.value) == 'A backend must be provided to cache responses.'
+
+
+def test_cached_conditional_responses():
+
+    calls = []
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+
+        config = {
+            'cache': {'backend': cache.MemoryCache()},
+            'conditional': True
+        }
+
+    @TestSchema()
+    def business_logic(**kwargs):
+        calls.append(kwargs)
+        return {'a': 1}
+
+    with app.test_request_context('/'):
+        response = app.process_response(app.make_response(business_logic()))
+    etag = response.headers['ETag']
+
+    with app.test_request_context('/', headers={'If-None-Match': etag}):
+        assert business_logic().status_code == 304
+    assert len(calls) == 1
+
+
+def test_fragment_cache(backend):
+
+    dumped = []
+
+    class TestSchema(BaseModelSchema):
+        id = fields.Int()
+        a = fields.Int()
+        b = fields.Method('get_b')
+
+        config = {'paged': False, 'fragment_cache': {'backend': backend}}
+
+        def get_b(self, obj):
+            dumped.append(obj['id'])
+            return obj['a'] * 2
+
+    first = datetime.datetime(2019, 1, 1)
+    models = [{'id': idx, 'a': idx, 'updated_dt': first} for idx in range(5)]
+    models.append({'id': 5, 'a': 5, 'updated_dt': None, 'created_dt': first})
+    models.append({'id': 6, 'a': 6})
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return models
+
+    def request(path='/'):
+        with app.test_request_context(path):
+            return json.loads(business_logic())['data']
+
+    expected = [{'id': idx, 'a': idx, 'b': idx * 2} for idx in range(7)]
+    assert request() == expected
+    assert dumped == list(range(7))
+
+    # Only changed objects and those without a version are serialized again
+    dumped.clear()
+    models[2] = dict(models[2], a=20, updated_dt=datetime.datetime(2019, 1, 2))
+    expected[2] = {'id': 2, 'a': 20, 'b': 40}
+    assert request() == expected
+    assert dumped == [2, 6]
+
+    # Projections are cached separately
+    dumped.clear()
+    assert request('/?fields=id,b') == [{'id': item['id'], 'b': item['b']} for item in expected]
+    assert dumped == list(range(7))
+    dumped.clear()
+    request('/?fields=b,id')
+    assert dumped == [6]
+
+    @TestSchema()
+    def resource_logic(**kwargs):
+        return models[2]
+
+    dumped.clear()
+    with app.test_request_context('/'):
+        assert json.loads(resource_logic()) == expected[2]
+    assert dumped == []
+
+
+def test_fragment_cache_post_dump(backend):
+
+    class TestSchema(BaseModelSchema):
+        id = fields.Int()
+        name = fields.String()
+
+        config = {'paged': False, 'fragment_cache': {'backend': backend}}
+
+        @post_dump
+        def exclaim(self, data, **kwargs):
+            data['name'] += '!'
+            return data
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return [{'id': 1, 'name': 'n1', 'updated_dt': datetime.datetime(2019, 1, 1)}]
+
+    # Hooks modifying items in place don't modify the cached fragments
+    for _ in range(3):
+        with app.test_request_context('/'):
+            assert json.loads(business_logic())['data'] == [{'id': 1, 'name': 'n1!'}]
+
+
+def test_memory_cache_batches(monkeypatch):
+
+    now = [100.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+
+    memory_cache = cache.MemoryCache(maxsize=3)
+    memory_cache.set_many({'a:1': 1, 'a:2': 2}, ttl=10)
+    memory_cache.set('a:3', 3, ttl=20)
+    assert memory_cache.get_many(['a:1', 'a:4']) == {'a:1': 1}
+    memory_cache.set_many({'a:4': 4}, ttl=20)
+    # a:2 was the least recently used
+    assert len(memory_cache) == 3
+    assert memory_cache.get_many(['a:1', 'a:2', 'a:3']) == {'a:1': 1, 'a:3': 3}
+
+    now[0] = 110.0
+    assert memory_cache.get_many(['a:1', 'a:3', 'a:4']) == {'a:3': 3, 'a:4': 4}
+    assert len(memory_cache) == 2
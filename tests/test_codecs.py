@@ -0,0 +1,131 @@
+"""Test the JSON and MessagePack backends."""
+# pylint: disable=protected-access,redefined-outer-name,invalid-name
+import json
+import sys
+
+import flask_exceptions
+import pytest
+from marshmallow import fields
+
+from conftest import app
+from luckycharms import codecs
+from luckycharms.base import BaseModelSchema
+
+
+@pytest.fixture(params=['json', 'orjson', 'rapidjson', 'ujson'])
+def backend(request):
+    """Yield each backend name, skipping those that are not installed."""
+    if request.param != 'json':
+        pytest.importorskip(request.param)
+    return request.param
+
+
+def test_backends(backend):
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+
+        config = {'json_backend': backend}
+
+    @TestSchema()
+    def business_logic(*args, **kwargs):
+        return kwargs
+
+    assert business_logic.__self__.json_codec.name == backend
+
+    with app.test_request_context(
+            '/',
+            method='POST',
+            data=json.dumps({'a': 1, 'b': 'Ünïcode/ü'}),
+            headers={'Content-Type': 'application/json'}
+            ):
+        assert json.loads(business_logic()) == {'a': 1, 'b': 'Ünïcode/ü'}
+
+    with app.test_request_context(
+            '/',
+            method='POST',
+            data="{'a': 1}",
+            headers={'Content-Type': 'application/json'}
+            ):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == 'Invalid json data'
+
+    @TestSchema(many=True)
+    def business_logic(*args, **kwargs):
+        return [{'a': 1, 'b': 'One'}, {'a': 2, 'b': 'Two'}]
+
+    with app.test_request_context('/?fields=b'):
+        assert json.loads(business_logic()) == {
+            'data': [{'b': 'One'}, {'b': 'Two'}],
+            'page_size': 25,
+            'next_page': False
+        }
+
+
+def test_backend_fallback(monkeypatch):
+
+    monkeypatch.setattr(codecs, '_CODECS', {'json': codecs.JSONCodec()})
+    monkeypatch.setitem(sys.modules, 'orjson', None)
+    assert codecs.get_codec('orjson').name == 'json'
+    assert codecs.get_codec('orjson') is codecs.get_codec('json')
+
+    with pytest.raises(Exception) as excinfo:
+        codecs.get_codec('simplejson')
+    assert str(excinfo.value) == 'Unknown JSON backend "simplejson".'
+
+
+def test_msgpack_rendering():
+    """Bodies and responses are MessagePack encoded per Content-Type and Accept."""
+    msgpack = pytest.importorskip('msgpack')
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+        c = fields.DateTime()
+
+    @TestSchema(many=True)
+    def business_logic(data):
+        return [dict(item, a=item['a'] * 2) for item in data]
+
+    body = msgpack.packb([{'a': 1, 'b': 'One', 'c': '2019-01-01T00:00:00'}, {'a': 2}])
+    for mimetype in ('application/msgpack', 'application/x-msgpack'):
+        with app.test_request_context('/', method='POST', data=body,
+                                      headers={'Content-Type': mimetype, 'Accept': mimetype}):
+            result = business_logic()
+            assert isinstance(result, bytes)
+            assert msgpack.unpackb(result) == {'data': [
+                {'a': 2, 'b': 'One', 'c': '2019-01-01T00:00:00'}, {'a': 4}]}
+
+    with app.test_request_context('/', method='POST', data=body[:-1],
+                                  headers={'Content-Type': 'application/msgpack'}):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == 'Invalid msgpack data'
+
+    with app.test_request_context('/', method='POST', data=msgpack.packb([{'a': 'x'}]),
+                                  headers={'Content-Type': 'application/msgpack'}):
+        with pytest.raises(flask_exceptions.BadRequest) as excinfo:
+            business_logic()
+        assert excinfo.value.message == "0: {'a': ['Not a valid integer.']}"
+
+    # Without msgpack installed, MessagePack requests are refused
+    business_logic.__self__.msgpack_codec = None
+    with app.test_request_context('/', method='POST', data=body,
+                                  headers={'Content-Type': 'application/msgpack'}):
+        with pytest.raises(flask_exceptions.APIException) as excinfo:
+            business_logic()
+        assert excinfo.value.status_code == 415
+    with app.test_request_context('/', method='POST', data=json.dumps([{'a': 1}]), headers={
+            'Content-Type': 'application/json', 'Accept': 'application/msgpack'}):
+        with pytest.raises(flask_exceptions.APIException) as excinfo:
+            business_logic()
+        assert excinfo.value.status_code == 406
+
+
+def test_msgpack_missing(monkeypatch):
+
+    monkeypatch.setattr(codecs, '_CODECS', {'json': codecs.JSONCodec()})
+    monkeypatch.setitem(sys.modules, 'msgpack', None)
+    assert codecs.get_msgpack_codec() is None
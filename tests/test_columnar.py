@@ -0,0 +1,164 @@
+"""Differential tests of columnar collection dumps against the dumps of their rows."""
+# pylint: disable=invalid-name,protected-access
+import datetime
+import json
+
+import pytest
+from marshmallow import Schema, fields
+
+from conftest import app
+from luckycharms.base import BaseModelSchema
+from luckycharms.cache import MemoryCache
+from luckycharms.columnar import column_rows, is_columnar
+
+numpy = pytest.importorskip('numpy')
+
+
+class ChildSchema(Schema):
+    """Schema nested in the differential schema."""
+
+    name = fields.Str()
+
+
+class ColumnarSchema(BaseModelSchema):
+    """A field of every kind, and columns of every dtype for them."""
+
+    id = fields.Int()
+    flag_int = fields.Int(attribute='flag', dump_only=True)
+    count_float = fields.Float(attribute='count', dump_only=True)
+    score = fields.Float()
+    score_string = fields.Float(attribute='score', as_string=True, dump_only=True)
+    name = fields.Str(data_key='title')
+    flag = fields.Bool()
+    count_bool = fields.Bool(attribute='count', dump_only=True)
+    created = fields.DateTime()
+    default = fields.Int(default=7)
+    absent = fields.Int()
+    child = fields.Nested(ChildSchema)
+    label = fields.Method('get_label')
+    skipped = fields.Method('get_skipped')
+
+    config = {'paged': False}
+
+    def get_label(self, obj):
+        return f'{obj["name"]} #{obj["id"]}'
+
+    def get_skipped(self, obj):
+        return obj['id'] if obj['id'] % 2 else fields.missing_
+
+
+def columns(size):
+    """Columns of each kind, as lists."""
+    return {
+        'id': list(range(size)),
+        'count': [idx % 3 for idx in range(size)],
+        'score': [idx / 3 for idx in range(size)],
+        'name': [f'item {idx}' for idx in range(size)],
+        'flag': [bool(idx % 2) for idx in range(size)],
+        'created': [datetime.datetime(2019, 1, 1, idx % 24, 0, 0, idx) for idx in range(size)],
+        'child': [{'name': f'child {idx}'} for idx in range(size)],
+    }
+
+
+def structured_array(size):
+    """Columns as a NumPy structured array."""
+    data = columns(size)
+    array = numpy.zeros(size, dtype=[
+        ('id', 'i8'), ('count', 'u2'), ('score', 'f4'), ('name', 'U16'), ('flag', '?'),
+        ('created', 'M8[us]'), ('child', 'O')])
+    for name, values in data.items():
+        array[name] = values
+    return array
+
+
+def shapes(size):
+    """Yield the same columns in each supported shape."""
+    data = columns(size)
+    yield 'lists', data
+    yield 'arrays', {name: numpy.array(values) for name, values in data.items()}
+    yield 'structured', structured_array(size)
+    pandas = pytest.importorskip('pandas')
+    yield 'dataframe', pandas.DataFrame(data)
+
+
+@pytest.mark.parametrize('size', [0, 1, 30])
+def test_columnar_dump(size):
+
+    schema = ColumnarSchema(many=True)
+    for shape, data in shapes(size):
+        assert is_columnar(data)
+        expected = schema._serialize(column_rows(data), many=True)
+        assert schema._serialize(data, many=True) == expected, shape
+        assert len(expected) == size
+        if size > 1:
+            assert 'skipped' not in expected[0] and expected[1]['skipped'] == 1
+            assert expected[0]['default'] == 7 and 'absent' not in expected[0]
+
+    assert not is_columnar([{'id': 1}])
+    assert not is_columnar(numpy.arange(3))
+
+
+def test_columnar_views():
+
+    class TestSchema(BaseModelSchema):
+        id = fields.Int(order=('asc',))
+        name = fields.Str()
+        score = fields.Float()
+
+        config = {'paged': 'cursor', 'query_plan': True}
+
+    def view_columns():
+        return {
+            'id': numpy.arange(30),
+            'name': numpy.array([f'item {idx}' for idx in range(30)]),
+            'score': numpy.linspace(0, 1, 30),
+        }
+
+    @TestSchema(many=True)
+    def business_logic(plan):
+        assert plan.attributes == ('id', 'name')
+        return view_columns()
+
+    with app.test_request_context('/?fields=id,name&page_size=10'):
+        result = json.loads(business_logic())
+    assert result['data'] == [{'id': idx, 'name': f'item {idx}'} for idx in range(10)]
+
+    @TestSchema(many=True)
+    def business_logic(plan):  # noqa: F811
+        return {'id': numpy.arange(30)}
+
+    with app.test_request_context('/?fields=id,name'):
+        with pytest.raises(Exception) as excinfo:
+            business_logic()
+        assert str(excinfo.value) == 'Attributes missing from the view result: name.'
+
+    class StreamedSchema(BaseModelSchema):
+        id = fields.Int()
+        score = fields.Float()
+
+        config = {'paged': False, 'streaming': True}
+
+    @StreamedSchema(many=True)
+    def business_logic(**kwargs):  # noqa: F811
+        return view_columns()
+
+    with app.test_request_context('/'):
+        response = business_logic()
+        chunks = list(response.response)
+    assert json.loads(b''.join(chunks))['data'] == [
+        {'id': idx, 'score': score} for idx, score in enumerate(numpy.linspace(0, 1, 30).tolist())]
+
+
+def test_columnar_fragments():
+
+    class TestSchema(BaseModelSchema):
+        id = fields.Int()
+        updated_dt = fields.DateTime()
+
+        config = {'paged': False, 'fragment_cache': {'backend': MemoryCache()}}
+
+    data = {'id': numpy.arange(3), 'updated_dt': [datetime.datetime(2019, 1, 1)] * 3}
+    schema = TestSchema(many=True)
+    assert schema._serialize(data, many=True) == [
+        {'id': idx, 'updated_dt': '2019-01-01T00:00:00'} for idx in range(3)]
+    assert len(schema.fragment_cache['backend']) == 3
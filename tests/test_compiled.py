@@ -0,0 +1,409 @@
+"""Differential tests of the generated dump and load functions against marshmallow."""
+# pylint: disable=invalid-name,protected-access
+import collections
+import datetime
+import decimal
+import json
+import random
+import types
+import uuid
+
+import flask_exceptions
+import pytest
+from marshmallow import EXCLUDE, INCLUDE, RAISE, Schema, ValidationError, fields, validate
+from marshmallow.error_store import ErrorStore
+
+from conftest import app
+from luckycharms.base import BaseModelSchema
+from luckycharms.compiled import compile_dump
+
+
+class TextSubclass(str):
+    """A str subclass, which String fields convert to str."""
+
+
+class Record(object):
+    """Model supporting item access, which get_value tries before attribute access."""
+
+    def __init__(self, **values):
+        self.values = values
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+
+class ChildSchema(Schema):
+    """Schema nested in the differential schemas."""
+
+    id = fields.Int()
+    name = fields.Str()
+
+
+DIFFERENTIAL_FIELDS = {
+    'int': fields.Int(),
+    'int_string': fields.Int(as_string=True),
+    'float': fields.Float(),
+    'float_string': fields.Float(as_string=True),
+    'str': fields.Str(),
+    'bool': fields.Bool(),
+    'bool_custom': fields.Bool(truthy={'y'}, falsy={'n'}),
+    'dt': fields.DateTime(),
+    'dt_rfc': fields.DateTime(format='rfc'),
+    'dt_custom': fields.DateTime(format='%Y/%m/%d %H'),
+    'raw': fields.Raw(),
+    'ints': fields.List(fields.Int()),
+    'matrix': fields.List(fields.List(fields.Str())),
+    'dts': fields.List(fields.DateTime()),
+    'renamed': fields.Int(data_key='renamedKey'),
+    'aliased': fields.Str(attribute='alias'),
+    'dotted': fields.Int(attribute='child.id'),
+    'default': fields.Int(default=7),
+    'default_callable': fields.Str(default=lambda: 'made'),
+    'items': fields.Str(),
+    'secret': fields.Str(load_only=True),
+    # Serialized by marshmallow
+    'method': fields.Method('get_method'),
+    'function': fields.Function(lambda obj: 'function'),
+    'child': fields.Nested(ChildSchema),
+    'children': fields.List(fields.Nested(ChildSchema)),
+    'decimal': fields.Decimal(),
+    'uuid': fields.UUID(),
+    'mapping': fields.Dict(),
+    'email': fields.Email(),
+}
+
+# Values for every field, including None and values of other types that fields convert
+VALUES = {
+    'int': [0, 5, -3, 2.7, '12', True, None],
+    'int_string': [0, 42, '8', None],
+    'float': [0.5, 3, '1.25', None],
+    'float_string': [1.5, 2, None],
+    'str': ['text', '', b'bytes', TextSubclass('sub'), 12, None],
+    'bool': [True, False, 0, 1, 'true', 'off', 'other', 2.5, None],
+    'bool_custom': ['y', 'n', True, 0, None],
+    'dt': [datetime.datetime(2019, 5, 1, 12, 30, 15, 123),
+           datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc), None],
+    'dt_rfc': [datetime.datetime(2019, 5, 1, 12, 30), None],
+    'dt_custom': [datetime.datetime(2019, 5, 1, 12, 30), None],
+    'raw': [{'a': [1]}, 'raw', None],
+    'ints': [[1, '2', 3.5], [], [None, 4], None],
+    'matrix': [[['a', 1], []], [], None],
+    'dts': [[datetime.datetime(2019, 1, 2)], None],
+    'renamed': [1, None],
+    'alias': ['aliased', None],
+    'child': [{'id': 3, 'name': 'child'}, None],
+    'default': [1, None],
+    'default_callable': ['given', None],
+    'items': ['items', None],
+    'secret': ['hidden'],
+    'children': [[{'id': 1, 'name': 'a'}, {'id': 2}], [], None],
+    'decimal': [decimal.Decimal('1.50'), None],
+    'uuid': [uuid.UUID(int=5), None],
+    'mapping': [{'k': 1}, None],
+    'email': ['user@example.com', None],
+}
+
+
+def make_values(rng):
+    """Pick a value for a random subset of attributes."""
+    return {
+        name: rng.choice(choices) for name, choices in VALUES.items() if rng.random() < 0.85
+    }
+
+
+def make_model(rng, values):
+    """Wrap values in one of the model types get_value supports."""
+    kind = rng.choice(('dict', 'object', 'record', 'ordered'))
+    if kind == 'dict':
+        return values
+    if kind == 'object':
+        return types.SimpleNamespace(**values)
+    if kind == 'record':
+        return Record(**values)
+    return collections.OrderedDict(values)
+
+
+def schema_classes(namespace=None, config=None):
+    """A compiled schema class and a marshmallow schema class with the same fields."""
+    namespace = {
+        **DIFFERENTIAL_FIELDS,
+        'get_method': lambda self, obj: 'method',
+        **(namespace or {}),
+    }
+    compiled = type('CompiledSchema', (BaseModelSchema,), {
+        **namespace, 'config': {'compiled_dump': True, **(config or {})}})
+    reference = type('ReferenceSchema', (BaseModelSchema,), {**namespace, 'config': config or {}})
+    return compiled, reference
+
+
+def assert_same_dump(compiled, reference, models):
+    """Compare the output of the compiled and reference schemas, one by one and as a list."""
+    for model in models:
+        assert compiled._serialize(model) == reference._serialize(model)
+    expected = reference._serialize(models, many=True)
+    result = compiled._serialize(models, many=True)
+    assert result == expected
+    assert [list(item) for item in result] == [list(item) for item in expected]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_differential_random_models(seed):
+    """Randomly generated models dump identically, whatever their type and missing values."""
+    rng = random.Random(seed)
+    Compiled, Reference = schema_classes()
+    models = [make_model(rng, make_values(rng)) for _ in range(50)]
+    assert_same_dump(Compiled(), Reference(), models)
+
+
+@pytest.mark.parametrize('options', [
+    {'only': ('int', 'str', 'renamed', 'method')},
+    {'only': ('dt', 'child', 'dotted')},
+    {'exclude': ('str', 'matrix', 'children')},
+    {'load_only': ('int', 'bool')},
+    {'dump_only': ('int',)},
+])
+def test_differential_projections(options):
+    """Schemas restricted to a subset of fields dump identically."""
+    rng = random.Random(repr(options))
+    Compiled, Reference = schema_classes()
+    models = [make_model(rng, make_values(rng)) for _ in range(50)]
+    assert_same_dump(Compiled(**options), Reference(**options), models)
+
+
+def test_differential_meta_options():
+    """Datetime formats and ordered output set in Meta are respected."""
+    rng = random.Random(0)
+
+    class Meta:
+        datetimeformat = '%d.%m.%Y'
+        ordered = True
+
+    Compiled, Reference = schema_classes({'Meta': Meta})
+    compiled, reference = Compiled(), Reference()
+    models = [make_model(rng, make_values(rng)) for _ in range(50)]
+    assert_same_dump(compiled, reference, models)
+    assert isinstance(compiled._serialize(models[0]), collections.OrderedDict)
+
+
+def test_differential_edge_models():
+    """Models without any attribute, None and dicts missing keys that are dict methods."""
+    Compiled, Reference = schema_classes()
+    models = [{}, object(), types.SimpleNamespace(), {'items': None}, None]
+    assert_same_dump(Compiled(), Reference(), models)
+    assert Compiled()._serialize(None, many=True) == Reference()._serialize(None, many=True)
+
+
+def test_differential_errors():
+    """Values a field cannot serialize raise the same errors."""
+    Compiled, Reference = schema_classes()
+    for values in ({'int': 'abc'}, {'float': object()}, {'bool': [1]}, {'dt': 'string'}):
+        with pytest.raises(Exception) as expected:
+            Reference()._serialize(values)
+        with pytest.raises(type(expected.value)):
+            Compiled()._serialize(values)
+
+
+def test_custom_accessors_fall_back():
+    """Schemas and fields that read attributes in their own way are serialized by marshmallow."""
+
+    class CustomField(fields.Str):
+        def get_value(self, obj, attr, accessor=None, default=None):
+            return 'custom'
+
+    Compiled, Reference = schema_classes({
+        'get_attribute': lambda self, obj, attr, default: obj.get(attr.upper(), default),
+        'custom': CustomField(),
+    })
+    assert compile_dump(Compiled()) is None
+    assert Compiled()._serialize({'INT': '1', 'int': 2})['int'] == 1
+    assert_same_dump(Compiled(), Reference(), [{'INT': 1, 'STR': 'a'}, {}])
+
+    Compiled, Reference = schema_classes({'custom': CustomField()})
+    assert Compiled()._serialize({'custom': 'value'})['custom'] == 'custom'
+    assert_same_dump(Compiled(), Reference(), [{'custom': 'value'}, {}])
+
+
+def test_compiled_views():
+    """Decorated views render the same responses with compiled dump functions."""
+    rng = random.Random(1)
+    Compiled, Reference = schema_classes()
+    models = [make_model(rng, make_values(rng)) for _ in range(30)]
+
+    responses = []
+    for schema_class in (Compiled, Reference):
+        @schema_class(many=True)
+        def business_logic(**kwargs):
+            return models
+
+        with app.test_request_context('/?page_size=10&fields=int,str,renamedKey,child,dt'):
+            responses.append(json.loads(business_logic()))
+
+        @schema_class()
+        def business_logic(**kwargs):
+            return models[0]
+
+        with app.test_request_context('/'):
+            responses.append(json.loads(business_logic()))
+
+    assert responses[:2] == responses[2:]
+
+
+LOAD_FIELDS = {
+    'required': fields.Int(required=True),
+    'ranged': fields.Int(validate=validate.Range(1, 10)),
+    'strict': fields.Int(strict=True),
+    'float': fields.Float(),
+    'nan': fields.Float(allow_nan=True),
+    'exclusive': fields.Float(validate=validate.Range(0, 1, min_inclusive=False,
+                                                      max_inclusive=False)),
+    'short': fields.Str(validate=validate.Length(max=5)),
+    'exact': fields.Str(validate=[validate.Length(equal=1), validate.OneOf(['a', 'b'])]),
+    'renamed': fields.Str(data_key='renamedKey'),
+    'dotted': fields.Str(attribute='parent.value'),
+    'bool': fields.Bool(),
+    'bool_custom': fields.Bool(truthy={'y'}, falsy={'n'}),
+    'raw': fields.Raw(),
+    'raw_choice': fields.Raw(validate=validate.OneOf({'x', 'y'})),
+    'nullable': fields.Raw(allow_none=True),
+    'default': fields.Str(missing='default'),
+    'default_callable': fields.Int(missing=lambda: 3),
+    'default_none': fields.Str(missing=None),
+    'ints': fields.List(fields.Int()),
+    'strs': fields.List(fields.Str(), validate=validate.Length(min=1)),
+    'matrix': fields.List(fields.List(fields.Float())),
+    'checked_items': fields.List(fields.Int(validate=validate.Range(0))),
+    'dt': fields.DateTime(),
+    'child': fields.Nested(ChildSchema),
+    'pattern': fields.Str(validate=validate.Regexp('^x')),
+    'dumped': fields.Int(dump_only=True),
+}
+
+INTS = [1, 0, 5, 11, -1, '5', 2.5, True, None, 'x', 2 ** 60]
+FLOATS = [0.5, 1, 0.0, float('nan'), float('inf'), '1.5', 2 ** 60, 2 ** 2000, None, True]
+STRS = ['a', 'b', 'abc', 'toolong', b'bytes', 5, None, '', 'xyz']
+BOOLS = [True, False, 'true', 0, 1, 'y', 'n', [], None]
+LISTS = [[1, 2], [], ['1', 2], [None], [-1], 'string', None, (1, 2), [[0.5, 1], []], [['x']]]
+
+LOAD_VALUES = {
+    'required': INTS,
+    'ranged': INTS,
+    'strict': INTS,
+    'float': FLOATS,
+    'nan': FLOATS,
+    'exclusive': FLOATS,
+    'short': STRS,
+    'exact': STRS,
+    'renamedKey': STRS,
+    'renamed': STRS,
+    'dotted': STRS,
+    'bool': BOOLS,
+    'bool_custom': BOOLS,
+    'raw': [{'a': 1}, 'raw', None, 0],
+    'raw_choice': [{'k': 1}, [1], 'x', 'z', None],
+    'nullable': [None, 1],
+    'default': STRS,
+    'default_callable': INTS,
+    'default_none': STRS,
+    'ints': LISTS,
+    'strs': LISTS + [['a', 'b']],
+    'matrix': LISTS,
+    'checked_items': LISTS,
+    'dt': ['2019-01-01T00:00:00', 'not a date', None],
+    'child': [{'id': 1, 'name': 'child'}, {'id': 'x'}, 'child', None],
+    'pattern': STRS,
+    'dumped': INTS,
+    'unknown': ['value'],
+    'other': [1],
+}
+
+
+def make_item(rng):
+    """Pick a value for a random subset of keys, or (rarely) an item of the wrong type."""
+    if rng.random() < 0.05:
+        return rng.choice([['list'], 'string', None, 5])
+    item = {key: rng.choice(choices) for key, choices in LOAD_VALUES.items() if rng.random() < 0.6}
+    return collections.OrderedDict(item) if rng.random() < 0.1 else item
+
+
+def load_classes(namespace=None):
+    """A compiled schema class and a marshmallow schema class with the same load fields."""
+    namespace = {**LOAD_FIELDS, **(namespace or {})}
+    compiled = type('CompiledSchema', (BaseModelSchema,), {
+        **namespace, 'config': {'compiled_load': True}})
+    reference = type('ReferenceSchema', (BaseModelSchema,), namespace)
+    return compiled, reference
+
+
+def deserialize(schema, data, **kwargs):
+    """Deserialize data, returning the representation of the result and of the errors."""
+    error_store = ErrorStore()
+    result = schema._deserialize(data, error_store=error_store, **kwargs)
+    return repr(result), repr(error_store.errors)
+
+
+@pytest.mark.parametrize('unknown', [RAISE, EXCLUDE, INCLUDE])
+@pytest.mark.parametrize('seed', range(10))
+def test_differential_load(seed, unknown):
+    """Random items, valid or not, load to the same values and errors."""
+    rng = random.Random(seed)
+    Compiled, Reference = load_classes()
+    compiled, reference = Compiled(), Reference()
+    items = [make_item(rng) for _ in range(100)]
+
+    for index, item in enumerate(items):
+        assert deserialize(compiled, item, unknown=unknown, index=index) == \
+            deserialize(reference, item, unknown=unknown, index=index)
+    assert deserialize(compiled, items, many=True, unknown=unknown) == \
+        deserialize(reference, items, many=True, unknown=unknown)
+
+
+def test_differential_load_options():
+    """Collections of the wrong type, unindexed errors and partial loading."""
+    rng = random.Random(0)
+
+    class Meta:
+        index_errors = False
+        ordered = True
+
+    Compiled, Reference = load_classes({'Meta': Meta})
+    items = [make_item(rng) for _ in range(50)]
+    for data in (items, {'a': 1}, 'string', None):
+        assert deserialize(Compiled(), data, many=True) == \
+            deserialize(Reference(), data, many=True)
+    assert deserialize(Compiled(), items, many=True, partial=True) == \
+        deserialize(Reference(), items, many=True, partial=True)
+
+
+def test_compiled_load_errors():
+    """Loading requests renders the same 400 messages."""
+    rng = random.Random(2)
+    Compiled, Reference = load_classes()
+    items = [make_item(rng) for _ in range(20)]
+
+    for data in [items, *items[:10]]:
+        messages = []
+        for schema in (Compiled(many=isinstance(data, list)),
+                       Reference(many=isinstance(data, list))):
+            with app.test_request_context('/', method='POST'):
+                try:
+                    messages.append(repr(schema.load(data)))
+                except (flask_exceptions.BadRequest, ValidationError) as error:
+                    messages.append(getattr(error, 'message', None))
+        assert messages[0] == messages[1]
+
+
+def test_compiled_load_views():
+    """Decorated views receive the same bodies."""
+    received = []
+    Compiled, Reference = load_classes({'unknown': fields.Str()})
+    body = json.dumps({'required': 1, 'ranged': 5, 'renamedKey': 'r', 'ints': [1, 2],
+                       'unknown': 'known', 'dotted': 'value'})
+    for schema_class in (Compiled, Reference):
+        @schema_class()
+        def business_logic(**kwargs):
+            received.append(kwargs)
+
+        with app.test_request_context('/', method='POST', data=body,
+                                      headers={'Content-Type': 'application/json'}):
+            business_logic()
+    assert received[0] == received[1]
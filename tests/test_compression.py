@@ -0,0 +1,156 @@
+"""Test response compression."""
+# pylint: disable=invalid-name
+import gzip
+import json
+import sys
+
+import pytest
+from marshmallow import fields
+
+from conftest import app
+from luckycharms import cache, compression
+from luckycharms.base import BaseModelSchema
+
+
+def decompress(encoding, body):
+    """Decompress a body with the module backing a content coding."""
+    if encoding == 'br':
+        return pytest.importorskip('brotli').decompress(body)
+    if encoding == 'zstd':
+        return pytest.importorskip('zstandard').ZstdDecompressor().decompressobj().decompress(body)
+    return gzip.decompress(body)
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br', 'zstd'])
+def test_compressed_responses(encoding):
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+        b = fields.String()
+
+        config = {'paged': False, 'compression': {'encodings': [encoding], 'min_size': 200}}
+
+    sizes = []
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return [{'a': idx, 'b': 'item'} for idx in range(sizes[-1])]
+
+    if business_logic.__self__.encodings.get(encoding) is None:
+        pytest.skip(f'{encoding} backend not installed')
+
+    for size, accept_encoding, compressed in [
+            (50, f'{encoding}, identity', True),
+            (50, f'{encoding};q=0', False),
+            (50, None, False),
+            (1, encoding, False)]:
+        headers = {} if accept_encoding is None else {'Accept-Encoding': accept_encoding}
+        sizes.append(size)
+        with app.test_request_context('/', headers=headers):
+            response = app.process_response(app.make_response(business_logic()))
+            assert response.headers.get('Content-Encoding') == (encoding if compressed else None)
+            assert 'Accept-Encoding' in response.vary
+            body = decompress(encoding, response.data) if compressed else response.data
+            assert len(json.loads(body)['data']) == size
+
+
+def test_negotiation():
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+
+        config = {'compression': {'min_size': 0}}
+
+    @TestSchema()
+    def business_logic(**kwargs):
+        return {'a': 1}
+
+    available = list(business_logic.__self__.encodings)
+    assert available[-1] == 'gzip'
+    for accept_encoding, expected in [
+            ('gzip, deflate, br, zstd', available[0]),
+            ('gzip;q=1, br;q=0.5, zstd;q=0.5', 'gzip'),
+            ('deflate', None)]:
+        with app.test_request_context('/', headers={'Accept-Encoding': accept_encoding}):
+            response = app.process_response(app.make_response(business_logic()))
+            assert response.headers.get('Content-Encoding') == expected
+
+
+def test_cached_compressed_responses(monkeypatch):
+
+    compressed = []
+    gzip_encoding = compression.get_encoding('gzip')
+    monkeypatch.setattr(gzip_encoding, 'compress', lambda data: compressed.append(data) or (
+        gzip.compress(data)))
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+
+        config = {
+            'cache': {'backend': cache.MemoryCache()},
+            'conditional': True,
+            'compression': {'encodings': ['gzip'], 'min_size': 0},
+        }
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return [{'a': 1}, {'a': 2}]
+
+    for accept_encoding in ('gzip', 'gzip', None, 'gzip'):
+        headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+        with app.test_request_context('/', headers=headers):
+            response = app.process_response(app.make_response(business_logic()))
+            body = gzip.decompress(response.data) if accept_encoding else response.data
+            assert json.loads(body)['data'] == [{'a': 1}, {'a': 2}]
+            # Compressed bodies get weak ETags, as they aren't the same bytes
+            assert response.get_etag()[1] is bool(accept_encoding)
+    assert len(compressed) == 1
+
+    etag = response.get_etag()[0]
+    with app.test_request_context('/', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': f'W/"{etag}"'}):
+        assert business_logic().status_code == 304
+    assert len(compressed) == 1
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br', 'zstd'])
+def test_streamed_compressed_responses(encoding):
+
+    class TestSchema(BaseModelSchema):
+        a = fields.Int()
+
+        config = {
+            'paged': False,
+            'streaming': True,
+            'compression': {'encodings': [encoding]}
+        }
+
+    @TestSchema(many=True)
+    def business_logic(**kwargs):
+        return ({'a': idx} for idx in range(250))
+
+    if business_logic.__self__.encodings.get(encoding) is None:
+        pytest.skip(f'{encoding} backend not installed')
+
+    with app.test_request_context('/', headers={'Accept-Encoding': encoding}):
+        response = business_logic()
+        assert response.headers['Content-Encoding'] == encoding
+        assert 'Accept-Encoding' in response.vary
+        chunks = list(response.response)
+
+    # The opening, each chunk of items and the closing are flushed as they are produced, even
+    # though the body is smaller than min_size
+    assert len(chunks) == 6 and all(chunks)
+    assert json.loads(decompress(encoding, b''.join(chunks)))['data'] == [
+        {'a': idx} for idx in range(250)]
+
+
+def test_encoding_backends(monkeypatch):
+
+    monkeypatch.setattr(compression, '_ENCODINGS', {'gzip': compression.GzipEncoding()})
+    monkeypatch.setitem(sys.modules, 'brotli', None)
+    assert compression.get_encoding('br') is None
+
+    with pytest.raises(Exception) as excinfo:
+        compression.get_encoding('deflate')
+    assert str(excinfo.value) == 'Unknown content coding "deflate".'
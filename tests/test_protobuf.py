@@ -0,0 +1,103 @@
+"""Test the descriptor based protocol buffer transformers."""
+# pylint: disable=protected-access,invalid-name
+import pytest
+from google.protobuf import descriptor_pb2, json_format, struct_pb2, wrappers_pb2
+
+from luckycharms import protobuf
+from protobuffers import proto, proto_pb2
+
+
+def test_matches_json_mapping():
+
+    data = {
+        'name': 'example.proto',
+        'dependency': ['a.proto', 'b.proto'],
+        'message_type': [{
+            'name': 'Example',
+            'field': [{
+                'name': 'a',
+                'number': 1,
+                'label': 'LABEL_REPEATED',
+                'type': 'TYPE_STRING'
+            }],
+            'options': {'deprecated': True}
+        }]
+    }
+    message = protobuf.fill_message(descriptor_pb2.FileDescriptorProto(), data)
+    assert message == json_format.ParseDict(data, descriptor_pb2.FileDescriptorProto())
+    assert protobuf.message_to_dict(message) == json_format.MessageToDict(
+        message, preserving_proto_field_name=True)
+    assert protobuf.message_to_dict(message) == data
+
+    struct = protobuf.fill_message(struct_pb2.Struct(), {
+        'fields': {'a': {'number_value': 1.5}, 'b': {'string_value': 'B'}}
+    })
+    assert struct['a'] == 1.5
+    assert protobuf.message_to_dict(struct) == {
+        'fields': {'a': {'number_value': 1.5}, 'b': {'string_value': 'B'}}
+    }
+
+
+def test_bytes_round_trip():
+
+    message = protobuf.fill_message(wrappers_pb2.BytesValue(), {'value': 'aGk='})
+    assert message.value == b'hi'
+    # The JSON mapping renders wrappers as their value
+    assert protobuf.message_to_dict(message) == {'value': json_format.MessageToDict(message)}
+    assert protobuf.fill_message(wrappers_pb2.BytesValue(), {'value': b'hi'}) == message
+
+
+def test_enums_none_and_unknown_fields():
+
+    message = protobuf.fill_message(descriptor_pb2.FieldDescriptorProto(), {
+        'name': 'a',
+        'number': None,
+        'type': 1,
+    })
+    assert protobuf.message_to_dict(message) == {'name': 'a', 'type': 'TYPE_DOUBLE'}
+
+    with pytest.raises(json_format.ParseError) as excinfo:
+        protobuf.fill_message(proto_pb2.Test(), {'d': 1})
+    assert str(excinfo.value) == \
+        'Message type "luckycharms.proto.remote.Test" has no field named "d".'
+
+
+def test_resource_transformer():
+
+    class Test(proto.Test):
+
+        @staticmethod
+        def _dict_to_message(data):
+            data['b'] = data['b'].upper()
+            return data
+
+        @staticmethod
+        def _message_to_dict(message):
+            return {'b': message.b.lower(), 'nested.value': message.a}
+
+    data = {'a': 1, 'b': 'One', 'c': False}
+    message = Test.dict_to_message(data)
+    assert data == {'a': 1, 'b': 'One', 'c': False}
+    assert message == proto_pb2.Test(a=1, b='ONE')
+    assert Test.proto_to_dict(message.SerializeToString()) == {
+        'a': 1,
+        'b': 'one',
+        'nested': {'value': 1}
+    }
+
+
+def test_collection_transformer():
+
+    data = {
+        'data': [{'a': 1, 'b': 'One', 'c': True}, {'a': 2, 'b': 'Two'}],
+        'page_size': 2,
+        'next_page': True
+    }
+    message = proto.TestCollection.dict_to_message(data)
+    assert message == proto_pb2.TestCollection(
+        tests=[proto_pb2.Test(a=1, b='One', c=True), proto_pb2.Test(a=2, b='Two')],
+        page_size=2,
+        next_page=True
+    )
+    assert proto.TestCollection.proto_to_dict(message.SerializeToString()) == data
+    assert proto.TestCollection.items_field == 'tests'